@@ -4,7 +4,7 @@ from flask import Flask, render_template, request, send_file, flash, url_for, se
 import os
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-from utils import anonymiser_pdf, anonymiser_fichier_fec, anonymiser_fichier_dsn, anonymiser_word_docx
+from jobs import soumettre_job, attendre_lot, statut_job, demarrer_prechauffage, modeles_prets
 from google_oauth import bp_google
 import openai
 import uuid
@@ -127,9 +127,9 @@ def index():
 
     if request.method == "POST":
         files = request.files.getlist("files[]")
-        for i, file in enumerate(files):
+        lot = []
+        for file in files:
             filename = secure_filename(file.filename)
-            ext = os.path.splitext(filename)[1].lower()
 
             if not allowed_file(filename):
                 flash(f"❌ Format non pris en charge : {filename}", "danger")
@@ -137,33 +137,18 @@ def index():
 
             input_path = os.path.join(UPLOAD_FOLDER_USER, filename)
             file.save(input_path)
+            lot.append((filename, soumettre_job(input_path, RESULT_FOLDER_USER, session_id, filename)))
 
-            try:
-                if ext == ".pdf":
-                    result_path = anonymiser_pdf(input_path)
-                elif ext == ".txt":
-                    result_path = anonymiser_fichier_fec(input_path)
-                elif ext == ".edi":
-                    result_path = anonymiser_fichier_dsn(input_path)
-                elif ext in {".doc", ".docx"}:
-                    result_path = anonymiser_word_docx(input_path)
-                else:
-                    result_path = None
-            except Exception as e:
-                print(f"❌ Erreur traitement fichier {filename} : {e}")
-                result_path = None
-
-            if result_path:
-                output_path = os.path.join(RESULT_FOLDER_USER, os.path.basename(result_path))
-                shutil.move(result_path, output_path)
-                nouveaux_fichiers.append(os.path.basename(output_path))
+        # Les fichiers sont traités en parallèle par le pool, les résultats reviennent dans l'ordre d'upload
+        resultats = attendre_lot([job_id for _, job_id in lot])
+        for (filename, _), (nom_resultat, erreur) in zip(lot, resultats):
+            if nom_resultat:
+                nouveaux_fichiers.append(nom_resultat)
             else:
                 flash(
-                    f"⚠️ Impossible d’anonymiser le fichier {filename} : format scanné ou contenu non exploitable.",
+                    f"⚠️ Impossible d’anonymiser le fichier {filename} : {erreur}.",
                     "warning"
                 )
-            if i < len(files) - 1:
-                time.sleep(2)
 
         historique = set(session.get("historique_fichiers", []))
         historique.update(nouveaux_fichiers)
@@ -173,6 +158,62 @@ def index():
     return render_template("index.html", fichiers=fichiers_actuels, synthese=synthese)
 
 
+@app.route("/jobs", methods=["POST"])
+def creer_jobs():
+    if "session_id" not in session:
+        session["session_id"] = str(uuid.uuid4())
+
+    session_id = session["session_id"]
+    UPLOAD_FOLDER_USER = os.path.join("uploads", session_id)
+    RESULT_FOLDER_USER = os.path.join("fichiers_anonymises", session_id)
+
+    os.makedirs(UPLOAD_FOLDER_USER, exist_ok=True)
+    os.makedirs(RESULT_FOLDER_USER, exist_ok=True)
+
+    jobs_crees = []
+    for file in request.files.getlist("files[]"):
+        filename = secure_filename(file.filename)
+
+        if not allowed_file(filename):
+            jobs_crees.append({"fichier": filename, "erreur": "Format non pris en charge."})
+            continue
+
+        input_path = os.path.join(UPLOAD_FOLDER_USER, filename)
+        file.save(input_path)
+
+        job_id = soumettre_job(input_path, RESULT_FOLDER_USER, session_id, filename)
+        jobs_crees.append({
+            "job_id": job_id,
+            "fichier": filename,
+            "statut_url": url_for("statut_job_route", job_id=job_id),
+            "resultat_url": url_for("resultat_job", job_id=job_id)
+        })
+
+    return jsonify({"success": True, "jobs": jobs_crees}), 202
+
+
+@app.route("/jobs/<job_id>")
+def statut_job_route(job_id):
+    etat = statut_job(job_id, session.get("session_id"))
+    if etat is None:
+        return jsonify({"success": False, "error": "Job introuvable."}), 404
+    return jsonify({"success": True, **etat})
+
+
+@app.route("/jobs/<job_id>/resultat")
+def resultat_job(job_id):
+    etat = statut_job(job_id, session.get("session_id"))
+    if etat is None:
+        return jsonify({"success": False, "error": "Job introuvable."}), 404
+    if etat["statut"] != "termine":
+        return jsonify({"success": False, **etat}), 409
+
+    historique = set(session.get("historique_fichiers", []))
+    historique.add(etat["resultat"])
+    session["historique_fichiers"] = list(historique)
+    return redirect(url_for("download_file", filename=etat["resultat"]))
+
+
 @app.route("/download/<filename>")
 def download_file(filename):
     session_id = session.get("session_id")
@@ -211,6 +252,19 @@ def delete_file(filename):
 
     return redirect(url_for("index"))
 
+@app.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    demarrer_prechauffage()
+    if modeles_prets():
+        return jsonify({"status": "ready"})
+    return jsonify({"status": "warming"}), 503
+
+
 @app.route("/api/google-credentials")
 def google_credentials():
     return {
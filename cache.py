@@ -0,0 +1,119 @@
+import os
+import shutil
+import hashlib
+import tempfile
+
+
+# === Configuration ===
+CACHE_ACTIF = os.environ.get("ANONYMISEUR_CACHE", "1") != "0"
+DOSSIER_CACHE = os.environ.get("ANONYMISEUR_CACHE_DIR", "cache_anonymisation")
+CACHE_TAILLE_MAX_MO = int(os.environ.get("ANONYMISEUR_CACHE_TAILLE_MAX_MO", 2048))
+
+
+# === Empreintes ===
+def hash_fichier(chemin_fichier):
+    sha = hashlib.sha256()
+    with open(chemin_fichier, "rb") as f:
+        for bloc in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(bloc)
+    return sha.hexdigest()
+
+
+def empreinte_modeles(chemins_modeles, parametres=None):
+    """
+    Empreinte des modèles (dossiers spaCy, poids YOLO) calculée sur le nom, la taille
+    et la date de modification de chaque fichier : un modèle ré-entraîné change l'empreinte.
+    parametres : version du code d'anonymisation et réglages qui changent la sortie ;
+    une nouvelle version ou un réglage modifié change aussi l'empreinte.
+    """
+    sha = hashlib.sha256()
+    for nom, valeur in sorted((parametres or {}).items()):
+        sha.update(f"{nom}={valeur!r}\n".encode())
+    for chemin in chemins_modeles:
+        if os.path.isfile(chemin):
+            fichiers = [chemin]
+        else:
+            fichiers = sorted(
+                os.path.join(racine, nom)
+                for racine, _, noms in os.walk(chemin)
+                for nom in noms
+            )
+        for fichier in fichiers:
+            stat = os.stat(fichier)
+            sha.update(f"{fichier}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return sha.hexdigest()[:16]
+
+
+def calculer_cle(chemin_fichier, type_fichier, chemins_modeles, parametres=None):
+    """Clé de cache : empreinte des modèles et paramètres / SHA-256 du contenu + type de fichier."""
+    empreinte = empreinte_modeles(chemins_modeles, parametres)
+    return os.path.join(empreinte, f"{hash_fichier(chemin_fichier)}{type_fichier}")
+
+
+# === Lecture / écriture ===
+def lire(cle, destination):
+    """Copie le résultat en cache vers destination. Retourne True si trouvé."""
+    if not CACHE_ACTIF:
+        return False
+    chemin = os.path.join(DOSSIER_CACHE, cle)
+    try:
+        shutil.copyfile(chemin, destination)
+        os.utime(chemin)  # LRU : la date de modification sert de date de dernier accès
+    except FileNotFoundError:
+        return False
+    print(f"♻️ Résultat trouvé en cache : {cle}")
+    return True
+
+
+def ecrire(cle, source):
+    if not CACHE_ACTIF:
+        return
+    try:
+        empreinte = os.path.dirname(cle)
+        invalider_empreintes(empreinte)
+
+        dossier = os.path.join(DOSSIER_CACHE, empreinte)
+        os.makedirs(dossier, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=dossier, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(source, temp)
+        os.replace(temp, os.path.join(DOSSIER_CACHE, cle))
+
+        evincer()
+    except OSError as e:
+        print("⚠️ Écriture cache impossible :", e)
+
+
+# === Invalidation / éviction ===
+def invalider_empreintes(empreinte_courante):
+    """Supprime les entrées produites avec d'autres versions des modèles, du code ou des réglages."""
+    if not os.path.isdir(DOSSIER_CACHE):
+        return
+    for nom in os.listdir(DOSSIER_CACHE):
+        if nom != empreinte_courante:
+            print(f"🗑 Cache invalidé (modèles, version ou réglages modifiés) : {nom}")
+            shutil.rmtree(os.path.join(DOSSIER_CACHE, nom), ignore_errors=True)
+
+
+def evincer():
+    """Supprime les entrées les moins récemment utilisées au-delà de la taille maximale."""
+    entrees = []
+    for racine, _, noms in os.walk(DOSSIER_CACHE):
+        for nom in noms:
+            chemin = os.path.join(racine, nom)
+            try:
+                stat = os.stat(chemin)
+            except FileNotFoundError:
+                continue
+            entrees.append((stat.st_mtime, stat.st_size, chemin))
+
+    taille_totale = sum(taille for _, taille, _ in entrees)
+    taille_max = CACHE_TAILLE_MAX_MO * 1024 * 1024
+    for _, taille, chemin in sorted(entrees):
+        if taille_totale <= taille_max:
+            break
+        try:
+            os.remove(chemin)
+        except FileNotFoundError:
+            pass
+        taille_totale -= taille
@@ -0,0 +1,102 @@
+"""
+Export du détecteur de signatures vers ONNX (et ONNX int8) pour l'inférence CPU,
+avec contrôle de parité des détections par rapport au modèle PyTorch best.pt.
+
+Nécessite : pip install onnx onnxruntime
+
+    python exporter_detecteur.py --int8 --images chemin/vers/images_test
+
+Le backend utilisé par l'application se choisit ensuite avec DETECTEUR_SIGNATURE=onnx (ou onnx-int8).
+"""
+import os
+import argparse
+
+from utils import MODELE_PATH3, CHEMINS_DETECTEUR
+
+EXTENSIONS_IMAGES = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"}
+
+
+def exporter_onnx(imgsz=640):
+    from ultralytics import YOLO
+
+    # dynamic=True : taille de lot variable, nécessaire au traitement des pages par lots
+    chemin = YOLO(MODELE_PATH3).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    print(f"✅ Export ONNX : {chemin}")
+    return chemin
+
+
+def quantifier_int8(chemin_onnx):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    chemin_int8 = CHEMINS_DETECTEUR["onnx-int8"]
+    quantize_dynamic(chemin_onnx, chemin_int8, weight_type=QuantType.QUInt8)
+    print(f"✅ Export ONNX int8 : {chemin_int8}")
+    return chemin_int8
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0
+
+
+def verifier_parite(dossier_images, chemin_candidat, iou_min=0.5, seuil=0.95):
+    """
+    Compare les détections du candidat à celles de best.pt sur un jeu d'images.
+    Une boîte de référence est retrouvée si une boîte candidate la recouvre à iou_min.
+    Retourne True si rappel et précision atteignent le seuil.
+    """
+    from ultralytics import YOLO
+
+    reference = YOLO(MODELE_PATH3, task="detect")
+    candidat = YOLO(chemin_candidat, task="detect")
+
+    images = sorted(
+        os.path.join(dossier_images, nom)
+        for nom in os.listdir(dossier_images)
+        if os.path.splitext(nom)[1].lower() in EXTENSIONS_IMAGES
+    )
+    if not images:
+        print(f"❌ Aucune image dans {dossier_images}")
+        return False
+
+    nb_ref = nb_cand = nb_apparies = 0
+    for image in images:
+        boites_ref = reference.predict(image, conf=0.25, save=False, verbose=False)[0].boxes.xyxy.cpu().numpy().tolist()
+        boites_cand = candidat.predict(image, conf=0.25, save=False, verbose=False)[0].boxes.xyxy.cpu().numpy().tolist()
+        nb_ref += len(boites_ref)
+        nb_cand += len(boites_cand)
+
+        restantes = list(boites_cand)
+        for boite in boites_ref:
+            meilleure = max(restantes, key=lambda b: iou(boite, b), default=None)
+            if meilleure is not None and iou(boite, meilleure) >= iou_min:
+                restantes.remove(meilleure)
+                nb_apparies += 1
+
+    rappel = nb_apparies / nb_ref if nb_ref else 1.0
+    precision = nb_apparies / nb_cand if nb_cand else 1.0
+    print(f"📊 {os.path.basename(chemin_candidat)} sur {len(images)} images : "
+          f"rappel {rappel:.3f}, précision {precision:.3f} ({nb_apparies}/{nb_ref} signatures retrouvées)")
+    return rappel >= seuil and precision >= seuil
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export ONNX du détecteur de signatures")
+    parser.add_argument("--int8", action="store_true", help="produit aussi une version quantifiée int8")
+    parser.add_argument("--images", help="dossier d'images de test pour le contrôle de parité")
+    parser.add_argument("--imgsz", type=int, default=640)
+    args = parser.parse_args()
+
+    chemins = [exporter_onnx(args.imgsz)]
+    if args.int8:
+        chemins.append(quantifier_int8(chemins[0]))
+
+    if args.images:
+        resultats = [verifier_parite(args.images, chemin) for chemin in chemins]
+        if not all(resultats):
+            print("❌ Parité insuffisante : garder DETECTEUR_SIGNATURE=pt")
+            raise SystemExit(1)
+        print("✅ Parité vérifiée")
@@ -1,4 +1,31 @@
 # gunicorn_conf.py
+import os
+import gc
+
 sendfile = False
 worker_class = "gthread"
 threads = 4
+# Chaque worker a son pool de jobs : jobs.py répartit les cœurs entre eux (ANONYMISEUR_JOB_WORKERS
+# fixe explicitement la taille de chaque pool) et partage l'état des jobs sur disque.
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+os.environ.setdefault("WEB_CONCURRENCY", str(workers))
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+timeout = 300
+
+# Les modèles sont chargés une fois dans le master puis partagés en copy-on-write
+# avec les workers (et les processus du pool de jobs, démarrés en fork).
+preload_app = True
+os.environ.setdefault("ANONYMISEUR_PRECHARGER", "1")
+os.environ.setdefault("ANONYMISEUR_MP_CONTEXTE", "fork")
+
+
+def on_starting(server):
+    import utils  # noqa: F401 — charge nlp, nlp2 et yolo (ANONYMISEUR_PRECHARGER)
+    # Les objets déjà alloués ne sont plus touchés par le GC : moins de pages recopiées après fork
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Préchauffage du pool de jobs du worker ; /readyz répond 200 une fois terminé
+    from jobs import demarrer_prechauffage
+    demarrer_prechauffage()
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import uuid
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+# === Configuration ===
+# Chaque worker gunicorn a son propre pool : le budget par défaut (les cœurs du conteneur)
+# est réparti entre les WEB_CONCURRENCY workers au lieu d'être multiplié par leur nombre
+WEB_WORKERS = int(os.environ.get("WEB_CONCURRENCY", 1))
+JOB_WORKERS = int(os.environ.get("ANONYMISEUR_JOB_WORKERS", max(1, (os.cpu_count() or 1) // WEB_WORKERS)))
+# Sous gevent, un fork hérite de l'état du hub : on démarre les workers en "spawn" par défaut
+MP_CONTEXTE = os.environ.get("ANONYMISEUR_MP_CONTEXTE", "spawn")
+JOB_RETENTION_S = int(os.environ.get("ANONYMISEUR_JOB_RETENTION_S", 3600))
+# État des jobs sur disque : lisible par tous les workers gunicorn, pas seulement celui
+# qui a reçu l'upload (le statut peut être demandé à n'importe lequel)
+DOSSIER_JOBS = os.environ.get("ANONYMISEUR_JOBS_DIR", "jobs_etat")
+
+# Préchauffage des workers (inférence factice) : activé avec le préchargement des modèles
+PRECHAUFFER = os.environ.get("ANONYMISEUR_PRECHARGER") == "1"
+
+_pool = None
+_pool_lock = threading.Lock()
+_prechauffage = None
+
+# Jobs soumis par ce worker web : job_id -> {"future", "session_id", "fichier", "cree_le"}
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+# === État partagé (fichiers JSON) ===
+def chemin_etat(job_id):
+    return os.path.join(DOSSIER_JOBS, f"{job_id}.json")
+
+
+def ecrire_etat(job_id, **champs):
+    """Met à jour l'état d'un job ; écriture atomique pour les lecteurs des autres workers."""
+    etat = lire_etat(job_id) or {}
+    etat.update(champs)
+    os.makedirs(DOSSIER_JOBS, exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=DOSSIER_JOBS, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(etat, f)
+    os.replace(temp, chemin_etat(job_id))
+
+
+def lire_etat(job_id):
+    try:
+        with open(chemin_etat(job_id), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def terminer_etat(job_id, future):
+    """Callback du future, dans le worker web : état final, y compris si le processus est mort."""
+    if future.cancelled():
+        ecrire_etat(job_id, statut="echec", erreur="Job annulé.")
+    elif future.exception() is not None:
+        ecrire_etat(job_id, statut="echec", erreur=str(future.exception()))
+    elif future.result() is None:
+        ecrire_etat(job_id, statut="echec", erreur="Format scanné ou contenu non exploitable.")
+    else:
+        ecrire_etat(job_id, statut="termine", resultat=future.result())
+
+
+# === Exécution dans le worker ===
+def executer_job(job_id, chemin_entree, dossier_resultat):
+    """
+    Anonymise un fichier dans un processus worker, directement dans le dossier
+    résultat de la session. Retourne le nom du fichier produit, ou None.
+    """
+    from utils import anonymiser_fichier, ContexteAnonymisation
+
+    ecrire_etat(job_id, statut="en_cours")
+
+    # Contexte propre au job : fichiers de travail isolés, supprimés à la fin
+    with ContexteAnonymisation(dossier_sortie=dossier_resultat, identifiant=job_id) as contexte:
+        result_path = anonymiser_fichier(chemin_entree, contexte)
+    if not result_path:
+        return None
+    return os.path.basename(result_path)
+
+
+def initialiser_worker():
+    if PRECHAUFFER:
+        from utils import prechauffer_modeles
+        prechauffer_modeles()
+
+
+def worker_pret():
+    return True
+
+
+# === Pool de workers ===
+def get_pool(casse=None):
+    """
+    Pool de jobs, créé au premier appel. Un pool cassé (un processus est mort : OOM sur un
+    gros scan...) refuse toute soumission : il est remplacé. casse : pool qui vient d'échouer,
+    remplacé seulement s'il est toujours le pool courant (un autre thread a pu le faire).
+    """
+    global _pool, _prechauffage
+    with _pool_lock:
+        if _pool is not None and (_pool is casse or getattr(_pool, "_broken", False)):
+            print("♻️ Pool de jobs cassé : reconstruction")
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            _prechauffage = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=JOB_WORKERS,
+                mp_context=multiprocessing.get_context(MP_CONTEXTE),
+                initializer=initialiser_worker
+            )
+            print(f"⚙️ Pool de jobs démarré : {JOB_WORKERS} worker(s) ({MP_CONTEXTE})")
+        return _pool
+
+
+def soumettre(fonction, *args):
+    pool = get_pool()
+    try:
+        return pool.submit(fonction, *args)
+    except BrokenProcessPool:
+        return get_pool(casse=pool).submit(fonction, *args)
+
+
+def demarrer_prechauffage():
+    """Démarre le pool ; le premier job ne s'exécute qu'une fois un worker préchauffé."""
+    global _prechauffage
+    with _pool_lock:
+        demarre = _prechauffage is not None
+    if not demarre:
+        future = soumettre(worker_pret)
+        with _pool_lock:
+            if _prechauffage is None:
+                _prechauffage = future
+
+
+def modeles_prets():
+    with _pool_lock:
+        future = _prechauffage
+    return future is not None and future.done() and future.exception() is None
+
+
+def purger_jobs():
+    limite = time.time() - JOB_RETENTION_S
+    with _jobs_lock:
+        for job_id in [j for j, job in _jobs.items() if job["cree_le"] < limite and job["future"].done()]:
+            del _jobs[job_id]
+
+    if not os.path.isdir(DOSSIER_JOBS):
+        return
+    for nom in os.listdir(DOSSIER_JOBS):
+        chemin = os.path.join(DOSSIER_JOBS, nom)
+        try:
+            if os.path.getmtime(chemin) < limite:
+                os.remove(chemin)
+        except FileNotFoundError:
+            pass
+
+
+# === API ===
+def soumettre_job(chemin_entree, dossier_resultat, session_id, fichier):
+    """Met un fichier en file d'anonymisation et retourne l'identifiant du job."""
+    purger_jobs()
+    job_id = uuid.uuid4().hex
+    ecrire_etat(
+        job_id, session_id=session_id, fichier=fichier, statut="en_attente",
+        resultat=None, erreur=None, cree_le=time.time()
+    )
+    try:
+        future = soumettre(executer_job, job_id, chemin_entree, dossier_resultat)
+    except Exception as e:
+        # Soumission impossible même sur un pool neuf : le job est enregistré en échec
+        print(f"❌ Soumission du job {job_id} impossible : {e}")
+        future = Future()
+        future.set_exception(e)
+    future.add_done_callback(lambda f: terminer_etat(job_id, f))
+    with _jobs_lock:
+        _jobs[job_id] = {
+            "future": future,
+            "session_id": session_id,
+            "fichier": fichier,
+            "cree_le": time.time(),
+        }
+    return job_id
+
+
+def attendre_lot(job_ids):
+    """
+    Attend un lot de jobs soumis ensemble et retourne, dans l'ordre de soumission,
+    une liste de (nom du fichier produit ou None, message d'erreur ou None).
+    """
+    resultats = []
+    for job_id in job_ids:
+        with _jobs_lock:
+            job = _jobs[job_id]
+        try:
+            resultat = job["future"].result()
+            erreur = None if resultat else "format scanné ou contenu non exploitable"
+        except Exception as e:
+            print(f"❌ Erreur job {job_id} ({job['fichier']}) : {e}")
+            resultat, erreur = None, str(e)
+        resultats.append((resultat, erreur))
+    return resultats
+
+
+def statut_job(job_id, session_id):
+    """
+    Retourne l'état d'un job de la session : en_attente, en_cours, termine ou echec.
+    Retourne None si le job est inconnu ou appartient à une autre session.
+    L'état est lu sur disque : il répond quel que soit le worker qui a créé le job.
+    """
+    etat = lire_etat(job_id)
+    if etat is None or etat.get("session_id") != session_id:
+        return None
+    return {
+        "job_id": job_id,
+        "fichier": etat["fichier"],
+        "statut": etat["statut"],
+        "resultat": etat.get("resultat"),
+        "erreur": etat.get("erreur"),
+    }
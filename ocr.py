@@ -0,0 +1,183 @@
+import os
+import time
+import queue
+import atexit
+import signal
+import tempfile
+import threading
+import multiprocessing
+from contextlib import contextmanager
+
+
+# === Configuration ===
+# Nombre d'OCR simultanés dans tout le conteneur (workers web et processus de jobs confondus) :
+# les demandes suivantes attendent qu'un emplacement se libère
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", 1))
+# Parallélisme ocrmypdf (pages OCRisées en même temps) pour un document
+OCR_JOBS = int(os.environ.get("OCR_JOBS", min(4, os.cpu_count() or 1)))
+# Délai maximal d'OCR d'un document, compté à partir de sa prise en charge par un worker
+OCR_TIMEOUT = int(os.environ.get("OCR_TIMEOUT", 120))
+DOSSIER_VERROUS_OCR = os.path.join(tempfile.gettempdir(), "anonymiseur_ocr")
+MP_CONTEXTE = os.environ.get("ANONYMISEUR_MP_CONTEXTE", "spawn")
+
+# Repli sans fcntl (Windows) : limite par processus seulement
+_emplacements_ocr = threading.BoundedSemaphore(OCR_WORKERS)
+
+# Workers OCR de ce processus : libres (réutilisés d'un document à l'autre) et tous
+_libres = queue.LifoQueue()
+_tous = []
+_tous_lock = threading.Lock()
+_arret_enregistre = None  # pid du processus où l'arrêt est enregistré
+
+
+# === Emplacements (limite du conteneur) ===
+@contextmanager
+def emplacement_ocr():
+    """
+    Attend l'un des OCR_WORKERS emplacements OCR du conteneur. Les verrous fcntl sont
+    vus par tous les processus et relâchés par le système si leur détenteur meurt.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        with _emplacements_ocr:
+            yield
+        return
+
+    os.makedirs(DOSSIER_VERROUS_OCR, exist_ok=True)
+    while True:
+        for i in range(OCR_WORKERS):
+            verrou = open(os.path.join(DOSSIER_VERROUS_OCR, f"emplacement_{i}.lock"), "w")
+            try:
+                fcntl.flock(verrou, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                verrou.close()
+                continue
+            try:
+                yield
+            finally:
+                verrou.close()  # relâche le verrou
+            return
+        time.sleep(0.2)  # tous les emplacements sont occupés
+
+
+# === Worker persistant ===
+def boucle_ocr(connexion):
+    """Exécuté dans le worker : ocrmypdf déjà importé, un document après l'autre."""
+    if hasattr(os, "setsid"):
+        os.setsid()  # groupe propre : le worker et ses tesseract sont tués d'un bloc
+    import ocrmypdf
+
+    while True:
+        try:
+            input_pdf, output_pdf, options = connexion.recv()
+        except EOFError:
+            return
+        try:
+            ocrmypdf.ocr(input_pdf, output_pdf, language='fra', force_ocr=True, jobs=OCR_JOBS, **options)
+            connexion.send(None)
+        except Exception as e:
+            connexion.send(f"{type(e).__name__} : {e}")
+
+
+class TravailleurOCR:
+    """Processus OCR de longue durée ; tué et remplacé seul s'il dépasse le délai."""
+
+    def __init__(self):
+        contexte = multiprocessing.get_context(MP_CONTEXTE)
+        self.connexion, connexion_worker = contexte.Pipe()
+        # Non démon : ocrmypdf lance lui-même des processus pour paralléliser les pages
+        self.process = contexte.Process(target=boucle_ocr, args=(connexion_worker,), name="ocr")
+        self.process.start()
+        connexion_worker.close()
+        self.pid_parent = os.getpid()
+
+    def ocr(self, input_pdf, output_pdf, options):
+        """Retourne None si l'OCR a abouti, le message d'erreur sinon. Lève TimeoutError."""
+        self.connexion.send((input_pdf, output_pdf, options))
+        if not self.connexion.poll(OCR_TIMEOUT):
+            raise TimeoutError(f"OCR > {OCR_TIMEOUT} s")
+        return self.connexion.recv()
+
+    def arreter(self):
+        # Un processus issu d'un fork hérite de la liste : seul le créateur arrête ses workers
+        if os.getpid() != self.pid_parent:
+            return
+        if self.process.is_alive():
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (AttributeError, ProcessLookupError, PermissionError):
+                self.process.kill()  # Windows, ou setsid pas encore exécuté
+        self.process.join(timeout=5)
+        self.connexion.close()
+
+
+def prendre_travailleur():
+    while True:
+        try:
+            travailleur = _libres.get_nowait()
+        except queue.Empty:
+            break
+        # Ignore les workers morts, et ceux hérités d'un parent par fork
+        if travailleur.pid_parent == os.getpid() and travailleur.process.is_alive():
+            return travailleur
+        jeter_travailleur(travailleur)
+
+    travailleur = TravailleurOCR()
+    with _tous_lock:
+        enregistrer_arret()
+        _tous.append(travailleur)
+    return travailleur
+
+
+def jeter_travailleur(travailleur):
+    travailleur.arreter()
+    with _tous_lock:
+        if travailleur in _tous:
+            _tous.remove(travailleur)
+
+
+def arreter_travailleurs():
+    with _tous_lock:
+        travailleurs = list(_tous)
+    for travailleur in travailleurs:
+        travailleur.arreter()
+
+
+def enregistrer_arret():
+    """Comme office.py : atexit, et Finalize pour les processus du pool de jobs."""
+    global _arret_enregistre
+    if _arret_enregistre == os.getpid():
+        return
+    _arret_enregistre = os.getpid()
+    from multiprocessing import util
+
+    atexit.register(arreter_travailleurs)
+    util.Finalize(None, arreter_travailleurs, exitpriority=10)
+
+
+# === API ===
+def lancer_ocr(input_pdf, output_pdf, **options):
+    """
+    OCR d'un PDF par un worker persistant, une fois un emplacement du conteneur obtenu.
+    Retourne True si l'OCR a abouti dans le délai. Au-delà, seul ce worker (et les
+    tesseract qu'il a lancés) est tué puis remplacé : les OCR des autres jobs continuent.
+    """
+    with emplacement_ocr():
+        travailleur = prendre_travailleur()
+        try:
+            erreur = travailleur.ocr(input_pdf, output_pdf, options)
+        except TimeoutError:
+            print(f"❌ OCR timeout ({OCR_TIMEOUT} s) : {input_pdf}")
+            jeter_travailleur(travailleur)
+            return False
+        except (EOFError, OSError) as e:
+            print("❌ Worker OCR interrompu :", e)
+            jeter_travailleur(travailleur)
+            return False
+
+    _libres.put(travailleur)
+    if erreur:
+        print("❌ OCR worker failed :", erreur)
+        return False
+    return True
@@ -0,0 +1,197 @@
+import os
+import time
+import shlex
+import atexit
+import signal
+import queue
+import socket
+import tempfile
+import threading
+import subprocess
+
+
+# === Configuration ===
+# Serveurs LibreOffice headless (unoserver) gardés chauds pour les conversions DOCX → PDF
+OFFICE_SERVEURS = int(os.environ.get("OFFICE_SERVEURS", 1))
+OFFICE_TIMEOUT = int(os.environ.get("OFFICE_TIMEOUT", 120))
+OFFICE_DEMARRAGE_TIMEOUT = int(os.environ.get("OFFICE_DEMARRAGE_TIMEOUT", 60))
+# Le serveur doit tourner avec un python qui voit le module uno de LibreOffice
+UNOSERVER_CMD = shlex.split(os.environ.get("UNOSERVER_CMD", "unoserver"))
+
+_serveurs = None
+_serveurs_pid = None  # processus propriétaire de la file : un fork en crée une nouvelle
+_serveurs_lock = threading.Lock()
+# Tous les serveurs créés, y compris ceux empruntés à la file au moment de l'arrêt
+_tous_serveurs = []
+
+
+def port_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServeurOffice:
+    """Un LibreOffice headless piloté par unoserver, redémarré s'il meurt ou se bloque."""
+
+    def __init__(self):
+        self.process = None
+        self.port = None
+
+    def actif(self):
+        return self.process is not None and self.process.poll() is None
+
+    def demarrer(self):
+        self.arreter()
+        self.port = port_libre()
+        self.process = subprocess.Popen(
+            UNOSERVER_CMD + [
+                "--interface", "127.0.0.1", "--port", str(self.port),
+                "--uno-interface", "127.0.0.1", "--uno-port", str(port_libre()),
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            # Groupe de processus propre : unoserver et son soffice sont arrêtés ensemble
+            start_new_session=True,
+        )
+
+        limite = time.time() + OFFICE_DEMARRAGE_TIMEOUT
+        while time.time() < limite:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"unoserver s'est arrêté au démarrage (code {self.process.returncode})")
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                print(f"📝 Serveur LibreOffice prêt (port {self.port})")
+                return
+            except OSError:
+                time.sleep(0.5)
+        self.arreter()
+        raise RuntimeError("unoserver n'a pas démarré à temps")
+
+    def signaler(self, signal_arret):
+        """Envoie le signal à tout le groupe (unoserver et soffice), pas seulement au wrapper."""
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(self.process.pid, signal_arret)
+            else:
+                self.process.send_signal(signal_arret)
+        except ProcessLookupError:
+            pass
+
+    def arreter(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.signaler(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        # Le wrapper parti, un soffice encore vivant dans le groupe ne doit pas rester orphelin
+        self.signaler(getattr(signal, "SIGKILL", signal.SIGTERM))
+        self.process = None
+
+    def convertir(self, chemin_entree, chemin_sortie):
+        try:
+            self.convertir_une_fois(chemin_entree, chemin_sortie)
+        except ConnectionError as e:
+            # Serveur mort pendant l'appel (connexion refusée ou coupée) : redémarrage
+            # et une seule nouvelle tentative
+            print("⚠️ Serveur LibreOffice injoignable, redémarrage :", e)
+            self.demarrer()
+            self.convertir_une_fois(chemin_entree, chemin_sortie)
+
+    def convertir_une_fois(self, chemin_entree, chemin_sortie):
+        from unoserver.client import UnoClient
+
+        if not self.actif():
+            self.demarrer()
+
+        erreurs = []
+
+        def conversion():
+            try:
+                UnoClient(server="127.0.0.1", port=str(self.port)).convert(
+                    inpath=chemin_entree, outpath=chemin_sortie, convert_to="pdf"
+                )
+            except Exception as e:
+                erreurs.append(e)
+
+        thread = threading.Thread(target=conversion, daemon=True)
+        thread.start()
+        thread.join(OFFICE_TIMEOUT)
+
+        if thread.is_alive():
+            # LibreOffice bloqué : on le tue, l'appel XML-RPC en cours échoue avec lui
+            self.arreter()
+            raise TimeoutError(f"Conversion LibreOffice > {OFFICE_TIMEOUT} s : {chemin_entree}")
+        if erreurs:
+            raise erreurs[0]
+
+
+def get_serveurs():
+    global _serveurs, _serveurs_pid
+    with _serveurs_lock:
+        if _serveurs is None or _serveurs_pid != os.getpid():
+            # Les serveurs hérités par fork appartiennent au parent : ni utilisés ni arrêtés ici
+            _tous_serveurs.clear()
+            _serveurs = queue.Queue()
+            _serveurs_pid = os.getpid()
+            for _ in range(OFFICE_SERVEURS):
+                serveur = ServeurOffice()
+                _tous_serveurs.append(serveur)
+                _serveurs.put(serveur)
+            enregistrer_arret()
+        return _serveurs
+
+
+def arreter_serveurs():
+    if _serveurs_pid != os.getpid():
+        return
+    for serveur in _tous_serveurs:
+        serveur.arreter()
+
+
+def enregistrer_arret():
+    """
+    Arrête les LibreOffice à la sortie du processus. Un processus du pool de jobs
+    (multiprocessing) n'exécute pas les fonctions atexit mais ses Finalize.
+    """
+    from multiprocessing import util
+
+    atexit.register(arreter_serveurs)
+    util.Finalize(None, arreter_serveurs, exitpriority=10)
+
+
+def convertir_libreoffice_direct(chemin_docx, dossier_sortie):
+    """Ancien mode : un LibreOffice lancé pour la conversion, avec son propre profil."""
+    with tempfile.TemporaryDirectory(prefix="lo_profile_") as profil:
+        subprocess.run(
+            [
+                "libreoffice", f"-env:UserInstallation=file://{profil}", "--headless",
+                "--convert-to", "pdf", "--outdir", dossier_sortie, chemin_docx,
+            ],
+            check=True,
+            timeout=OFFICE_TIMEOUT,
+        )
+
+
+def convertir_en_pdf(chemin_docx, dossier_sortie):
+    """
+    Convertit un document en PDF via un serveur LibreOffice du pool (attente si tous
+    sont occupés). Retombe sur un lancement direct de LibreOffice si unoserver est absent.
+    Retourne le chemin du PDF produit.
+    """
+    chemin_pdf = os.path.join(dossier_sortie, os.path.splitext(os.path.basename(chemin_docx))[0] + ".pdf")
+
+    serveurs = get_serveurs()
+    serveur = serveurs.get()
+    try:
+        serveur.convertir(chemin_docx, chemin_pdf)
+    except (ImportError, FileNotFoundError, RuntimeError) as e:
+        print("⚠️ unoserver indisponible, conversion LibreOffice directe :", e)
+        convertir_libreoffice_direct(chemin_docx, dossier_sortie)
+    finally:
+        serveurs.put(serveur)
+    return chemin_pdf
@@ -1,113 +1,514 @@
+import io
 import os
+import codecs
+import importlib.util
 import re
 import fitz
 import pandas as pd
-from faker import Faker
-import spacy
-import ocrmypdf
-from multiprocessing import Process, Queue
+import time
+import uuid
 import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-import cv2
-from pdf2image import convert_from_path
-from ultralytics import YOLO
 import numpy as np
 from PIL import Image
-import subprocess
+import shutil
+import weakref
 
 import tempfile
-from docx import Document
-from docx.shared import Inches
 
-from docx2pdf import convert
+import cache
+import jobs
+from ocr import lancer_ocr
+
+# spaCy, ultralytics, OpenCV, ocrmypdf, pytesseract et python-docx sont importés
+# par les fonctions qui en ont besoin : un worker qui ne traite que des FEC/DSN ne les charge jamais.
 
 
 # === Configuration ===
-fake = Faker("fr_FR")
+# À incrémenter à chaque changement du code qui modifie les fichiers produits (nouvelle
+# zone masquée, autre rendu...) : les résultats en cache des versions précédentes sont effacés
+VERSION_PIPELINE = 3
 DOSSIER_ANONYMISÉ = "fichiers_anonymises"
 os.makedirs(DOSSIER_ANONYMISÉ, exist_ok=True)
 
-# === Chargement modèle spaCy personnalisé ===
-MODELE_PATH = os.path.join(os.path.dirname(__file__), "models", "model-best")
-nlp = spacy.load(MODELE_PATH)
 
-MODELE_PATH2 = os.path.join(os.path.dirname(__file__), "models", "model-best2")
-nlp2 = spacy.load(MODELE_PATH2)
+# === Contexte d'un job ===
+class ContexteAnonymisation:
+    """
+    État propre à un job : dossier de sortie, dossier de travail, correspondances FEC
+    et réglages. Transmis aux fonctions anonymiser_*, il permet à plusieurs jobs de
+    partager un même processus (et ses modèles chargés) sans compteur ni fichier
+    temporaire commun. Les réglages reprennent les variables d'environnement par défaut.
+    """
 
+    def __init__(self, dossier_sortie=DOSSIER_ANONYMISÉ, identifiant=None, **reglages):
+        # Identifiant du job (celui de jobs.py) : relie au job les fichiers produits hors sortie
+        self.identifiant = identifiant or uuid.uuid4().hex
+        self.dossier_sortie = dossier_sortie
+        self.dossier_travail = tempfile.mkdtemp(prefix="anonymisation_")
+        # Supprimé à la fermeture du contexte, ou à défaut quand il n'est plus référencé
+        self._nettoyage = weakref.finalize(self, shutil.rmtree, self.dossier_travail, True)
+
+        # FEC : correspondances original -> pseudonyme et tirages du fichier en cours
+        self.pseudonymes_comptes = {}
+        self.pseudonymes_tiers = {}
+        self.rng = np.random.default_rng()
+
+        self.fec_streaming_seuil_mo = FEC_STREAMING_SEUIL_MO
+        self.fec_lignes_par_lot = FEC_LIGNES_PAR_LOT
+        self.fec_arrow = FEC_ARROW
+        self.fec_export_correspondances = FEC_EXPORT_CORRESPONDANCES
+        for nom, valeur in reglages.items():
+            if not nom.startswith("fec_") or not hasattr(self, nom):
+                raise TypeError(f"Réglage inconnu : {nom}")
+            setattr(self, nom, valeur)
+
+    def chemin_travail(self, nom_fichier):
+        return os.path.join(self.dossier_travail, nom_fichier)
+
+    def chemin_sortie(self, nom_fichier):
+        os.makedirs(self.dossier_sortie, exist_ok=True)
+        return os.path.join(self.dossier_sortie, nom_fichier)
+
+    def fermer(self):
+        self._nettoyage()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+# === Modèles (chargés à la première utilisation) ===
+MODELE_PATH = os.path.join(os.path.dirname(__file__), "models", "model-best")
+MODELE_PATH2 = os.path.join(os.path.dirname(__file__), "models", "model-best2")
 MODELE_PATH3 = os.path.join(os.path.dirname(__file__), "models", "runs1", "train","signature-detector","weights", "best.pt")
-yolo = YOLO(MODELE_PATH3)
 
+# Backend du détecteur de signatures : "pt" (PyTorch), "onnx" ou "onnx-int8" (onnxruntime CPU).
+# Les fichiers ONNX sont produits à côté de best.pt par exporter_detecteur.py.
+DETECTEUR_SIGNATURE = os.environ.get("DETECTEUR_SIGNATURE", "pt")
+CHEMINS_DETECTEUR = {
+    "pt": MODELE_PATH3,
+    "onnx": MODELE_PATH3.replace(".pt", ".onnx"),
+    "onnx-int8": MODELE_PATH3.replace(".pt", "-int8.onnx"),
+}
 
-# === FEC ===
-# --- Compteurs pour générer des identifiants anonymes ---
-compteur_personne = 1
-compteur_client = 1
-
-# --- Fonctions anonymisation ---
-def anonymiser_compte(val):
-    if pd.notna(val):
-        val_str = str(val)
-        visible = val_str[:4]
-        return visible + "X" * (len(val_str) - 4)
-    return val
-
-def anonymiser_piece(val):
-    return "REF-" + str(fake.random_int(min=10000, max=99999)) if pd.notna(val) else val
-
-def anonymiser_nom_generique(prefixe):
-    global compteur_personne
-    identifiant = f"{prefixe}{str(compteur_personne).zfill(3)}"
-    compteur_personne += 1
-    return identifiant
-
-def anonymiser_client_generique():
-    global compteur_client
-    identifiant = f"Client{str(compteur_client).zfill(3)}"
-    compteur_client += 1
-    return identifiant
-
-def detecter_separateur(chemin_fichier):
-    with open(chemin_fichier, 'r', encoding='utf-8', errors='ignore') as f:
-        ligne = f.readline()
-        return "|" if ligne.count("|") > ligne.count("\t") else "\t"
+# Nombre de textes par lot envoyés à nlp.pipe
+NLP_BATCH_SIZE = int(os.environ.get("NLP_BATCH_SIZE", 64))
 
-# --- Fonction principale ---
-def anonymiser_fichier_fec(chemin_fichier):
-    global compteur_personne, compteur_client
-    compteur_personne = 1
-    compteur_client = 1
+MODELES_NER = {"nlp": MODELE_PATH, "nlp2": MODELE_PATH2}
+
+_modeles = {}
+_modeles_lock = threading.Lock()
+# Une inférence à la fois par modèle : des jobs en threads partagent les mêmes modèles chargés
+_verrous_inference = {nom: threading.Lock() for nom in [*MODELES_NER, "yolo"]}
+
+
+def modele_spacy(nom):
+    """Modèle spaCy "nlp" (bulletins) ou "nlp2" (contrats, Word), chargé au premier appel."""
+    with _modeles_lock:
+        if nom not in _modeles:
+            import spacy
+            print(f"⏳ Chargement du modèle spaCy {nom}...")
+            _modeles[nom] = spacy.load(MODELES_NER[nom])
+        return _modeles[nom]
+
+
+def chemin_detecteur():
+    """Poids du détecteur pour le backend configuré ; retombe sur best.pt si l'export manque."""
+    if DETECTEUR_SIGNATURE == "pt":
+        return MODELE_PATH3
+    chemin = CHEMINS_DETECTEUR.get(DETECTEUR_SIGNATURE)
+    if chemin is None or not os.path.exists(chemin):
+        print(f"⚠️ Détecteur '{DETECTEUR_SIGNATURE}' indisponible, utilisation de {MODELE_PATH3}")
+        return MODELE_PATH3
+    return chemin
+
+
+def modele_yolo():
+    """Détecteur de signatures YOLO, chargé au premier appel."""
+    with _modeles_lock:
+        if "yolo" not in _modeles:
+            from ultralytics import YOLO
+            chemin = chemin_detecteur()
+            print(f"⏳ Chargement du détecteur de signatures YOLO ({os.path.basename(chemin)})...")
+            _modeles["yolo"] = YOLO(chemin, task="detect")
+        return _modeles["yolo"]
+
+
+def precharger_modeles():
+    for nom in MODELES_NER:
+        modele_spacy(nom)
+    modele_yolo()
+
+
+def prechauffer_modeles():
+    """Charge les modèles puis fait une inférence factice pour initialiser leurs buffers."""
+    precharger_modeles()
+    for nom in MODELES_NER:
+        with _verrous_inference[nom]:
+            modele_spacy(nom)("Monsieur Jean DUPONT, 12 rue de la Paix 75002 Paris")
+    with _verrous_inference["yolo"]:
+        modele_yolo().predict(np.zeros((640, 640, 3), dtype=np.uint8), conf=0.25, save=False, verbose=False)
+    print("🔥 Modèles préchauffés")
+    return True
+
+
+# === Pools de processus (pages) ===
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_processus(nom, max_workers, casse=None):
+    """
+    Pool de processus persistant, créé au premier appel et réutilisé entre documents.
+    Un pool cassé (processus mort) est remplacé ; casse : pool qui vient d'échouer.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    with _pools_lock:
+        pool = _pools.get(nom)
+        if pool is not None and (pool is casse or getattr(pool, "_broken", False)):
+            print(f"♻️ Pool '{nom}' cassé : reconstruction")
+            pool.shutdown(wait=False, cancel_futures=True)
+            del _pools[nom]
+        if nom not in _pools:
+            contexte = multiprocessing.get_context(os.environ.get("ANONYMISEUR_MP_CONTEXTE", "spawn"))
+            _pools[nom] = ProcessPoolExecutor(max_workers=max_workers, mp_context=contexte)
+        return _pools[nom]
+
+
+# === Cache NER ===
+# Les libellés répétés d'une page à l'autre ("Salaire de base", "Net à payer", en-têtes)
+# ne repassent pas par le modèle : cache LRU par modèle, partagé entre documents du worker.
+NER_CACHE_TAILLE = int(os.environ.get("NER_CACHE_TAILLE", 50_000))
+
+Entite = namedtuple("Entite", ["text", "label_", "start_char", "end_char"])
+
+
+class CacheNER:
+    def __init__(self, taille_max):
+        self.taille_max = taille_max
+        self.entrees = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, cle):
+        with self.lock:
+            if cle in self.entrees:
+                self.entrees.move_to_end(cle)
+                self.hits += 1
+                return self.entrees[cle]
+            self.misses += 1
+            return None
 
+    def put(self, cle, entites):
+        with self.lock:
+            self.entrees[cle] = entites
+            self.entrees.move_to_end(cle)
+            while len(self.entrees) > self.taille_max:
+                self.entrees.popitem(last=False)
+
+
+caches_ner = {nom: CacheNER(NER_CACHE_TAILLE) for nom in MODELES_NER}
+
+
+def entites_par_lot(nom_modele, textes):
+    """
+    Retourne, pour chaque texte, la liste de ses entités (Entite).
+    Le texte est normalisé (espaces de bord retirés) pour la clé du cache ; les textes
+    absents du cache passent ensemble dans nlp.pipe. Les offsets restent ceux du texte d'origine.
+    """
+    cache_ner = caches_ner[nom_modele]
+    normalises = [texte.strip() for texte in textes]
+    resultats = [cache_ner.get(cle) if cle else [] for cle in normalises]
+
+    a_calculer = list(dict.fromkeys(cle for cle, res in zip(normalises, resultats) if res is None))
+    if a_calculer:
+        calcules = {}
+        with _verrous_inference[nom_modele]:
+            for cle, doc_spacy in zip(a_calculer, modele_spacy(nom_modele).pipe(a_calculer, batch_size=NLP_BATCH_SIZE)):
+                calcules[cle] = [Entite(ent.text, ent.label_, ent.start_char, ent.end_char) for ent in doc_spacy.ents]
+                cache_ner.put(cle, calcules[cle])
+        resultats = [calcules[cle] if res is None else res for cle, res in zip(normalises, resultats)]
+
+    entites = []
+    for texte, ents in zip(textes, resultats):
+        decalage = len(texte) - len(texte.lstrip())
+        if decalage:
+            ents = [
+                ent._replace(start_char=ent.start_char + decalage, end_char=ent.end_char + decalage)
+                for ent in ents
+            ]
+        entites.append(ents)
+    return entites
+
+
+def entites_texte(nom_modele, texte):
+    return entites_par_lot(nom_modele, [texte])[0]
+
+
+def statistiques_cache_ner():
+    return {
+        nom: {"hits": c.hits, "misses": c.misses, "taille": len(c.entrees)}
+        for nom, c in caches_ner.items()
+    }
+
+
+# Préchargement optionnel pour la production (évite la latence du premier document)
+if os.environ.get("ANONYMISEUR_PRECHARGER") == "1":
+    precharger_modeles()
+
+
+# === FEC ===
+# Au-delà de cette taille, le FEC est lu et anonymisé par lots (mémoire bornée)
+FEC_STREAMING_SEUIL_MO = int(os.environ.get("FEC_STREAMING_SEUIL_MO", 100))
+FEC_LIGNES_PAR_LOT = int(os.environ.get("FEC_LIGNES_PAR_LOT", 200_000))
+# Lecture CSV avec le moteur pyarrow (multi-thread) et des chaînes Arrow, si pyarrow est installé
+FEC_ARROW = os.environ.get("FEC_ARROW") == "1"
+TAILLE_ECHANTILLON_FEC = 64 * 1024
+
+# Export (chiffré) de la table original -> pseudonyme de chaque FEC, pour les ayants droit
+FEC_EXPORT_CORRESPONDANCES = os.environ.get("FEC_EXPORT_CORRESPONDANCES") == "1"
+DOSSIER_CORRESPONDANCES = os.environ.get("FEC_DOSSIER_CORRESPONDANCES", "correspondances_fec")
+
+# --- Fonctions anonymisation (vectorisées : une opération par colonne, pas par ligne) ---
+def anonymiser_comptes(serie):
+    """Garde les 4 premiers caractères de chaque numéro de compte et remplace le reste par des X."""
+    presents = serie.notna()
+    longueurs = (serie.str.len().fillna(0).astype(int) - 4).clip(lower=0).to_numpy()
+    # Peu de longueurs distinctes : les bourrages sont construits une fois puis indexés
+    bourrages = np.array(["X" * n for n in range(longueurs.max(initial=0) + 1)], dtype=object)
+    return (serie.str[:4] + bourrages[longueurs]).where(presents, serie)
+
+def anonymiser_pieces(serie, rng):
+    """Une référence REF-NNNNN aléatoire par pièce, tirées en un seul appel."""
+    refs = pd.Series(rng.integers(10000, 100000, size=len(serie)).astype(str), index=serie.index)
+    return ("REF-" + refs).where(serie.notna(), serie)
+
+def pseudonymes_stables(serie, prefixe, correspondances):
+    """
+    Un pseudonyme stable par valeur distincte (prefixe001, prefixe002... dans l'ordre d'apparition).
+    La colonne est factorisée : seules les valeurs uniques passent par le dictionnaire
+    correspondances (original -> pseudonyme), complété au fil des lots d'un même fichier.
+    """
+    codes, uniques = pd.factorize(serie)
+    for valeur in uniques:
+        if valeur not in correspondances:
+            correspondances[valeur] = f"{prefixe}{str(len(correspondances) + 1).zfill(3)}"
+    # Dernière case pour le code -1 des valeurs absentes, restaurées ensuite par where
+    pseudonymes = np.array([correspondances[valeur] for valeur in uniques] + [None], dtype=object)
+    return pd.Series(pseudonymes[codes], index=serie.index).where(codes >= 0, serie)
+
+def exporter_correspondances(nom_fichier, contexte):
+    """
+    Exporte la table de correspondance du FEC du contexte, chiffrée (Fernet) avec la clé
+    FEC_CLE_CORRESPONDANCES, hors du dossier des fichiers servis, dans un sous-dossier
+    au nom du job. Jamais écrite en clair.
+    """
+    cle = os.environ.get("FEC_CLE_CORRESPONDANCES")
+    if not cle:
+        print("⚠️ FEC_CLE_CORRESPONDANCES absente : table de correspondance non exportée")
+        return None
     try:
-        sep = detecter_separateur(chemin_fichier)
+        from cryptography.fernet import Fernet
+    except ImportError:
+        print("⚠️ cryptography non installé : table de correspondance non exportée")
+        return None
+
+    table = pd.concat([
+        pd.DataFrame({"colonne": colonne, "original": list(correspondances), "pseudonyme": list(correspondances.values())})
+        for colonne, correspondances in (
+            ("CompteLib", contexte.pseudonymes_comptes), ("CompAuxLib", contexte.pseudonymes_tiers)
+        )
+    ])
+    contenu = Fernet(cle.encode()).encrypt(table.to_csv(index=False).encode("utf-8"))
+
+    dossier = os.path.join(DOSSIER_CORRESPONDANCES, contexte.identifiant)
+    os.makedirs(dossier, exist_ok=True)
+    chemin = os.path.join(dossier, f"{nom_fichier}.correspondances.csv.enc")
+    with open(chemin, "wb") as f:
+        f.write(contenu)
+    print(f"🔐 Table de correspondance chiffrée : {chemin}")
+    return chemin
+
+def sonder_fec(chemin_fichier):
+    """
+    Lit une seule fois un échantillon du début du fichier pour choisir l'encodage
+    (BOM, UTF-8, sinon latin1) et le séparateur (| ou tabulation, d'après l'en-tête).
+    L'encodage n'est qu'une présomption : un octet non UTF-8 plus loin fait relire en latin1.
+    """
+    with open(chemin_fichier, "rb") as f:
+        echantillon = f.read(TAILLE_ECHANTILLON_FEC)
 
-        # Tentative avec utf-8, sinon latin1
+    if echantillon.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    else:
         try:
-            df = pd.read_csv(chemin_fichier, sep=sep, dtype=str, encoding='utf-8')
+            # final=False : un caractère coupé par la fin de l'échantillon n'est pas une erreur
+            codecs.getincrementaldecoder("utf-8")().decode(echantillon, final=False)
+            encoding = "utf-8"
         except UnicodeDecodeError:
-            df = pd.read_csv(chemin_fichier, sep=sep, dtype=str, encoding='latin1')
+            encoding = "latin1"
+
+    ligne = echantillon.split(b"\n", 1)[0]
+    sep = "|" if ligne.count(b"|") > ligne.count(b"\t") else "\t"
+    return encoding, sep
+
+def arrow_disponible(contexte):
+    return contexte.fec_arrow and importlib.util.find_spec("pyarrow") is not None
+
+
+def options_lecture_fec(encoding, sep, contexte):
+    """
+    Options de pd.read_csv (moteur C) : chaînes Arrow si fec_arrow et pyarrow installé.
+    Jamais engine="pyarrow" : il infère les types avant le cast dtype ("0001" devient 1).
+    """
+    options = {"sep": sep, "encoding": encoding, "dtype": str}
+    if arrow_disponible(contexte):
+        options["dtype"] = "string[pyarrow]"
+    return options
+
+
+def lire_fec_arrow(chemin_fichier, encoding, sep):
+    """
+    Lecture multi-thread par pyarrow.csv, chaque colonne de l'en-tête étant déclarée chaîne :
+    aucune inférence de type, zéros de tête et cellules vides conservés comme avec le moteur C.
+    """
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    with open(chemin_fichier, encoding=encoding, newline="") as f:
+        entete = f.readline().rstrip("\r\n").split(sep)
+    table = pa_csv.read_csv(
+        chemin_fichier,
+        read_options=pa_csv.ReadOptions(encoding=encoding),
+        parse_options=pa_csv.ParseOptions(delimiter=sep),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={col: pa.string() for col in entete},
+            strings_can_be_null=True,  # cellule vide -> NaN, comme pd.read_csv
+        ),
+    )
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+
 
-        # Colonnes à anonymiser
-        colonnes_requises = ["CompteNum", "CompteLib", "CompAuxNum", "CompAuxLib", "PieceRef", "EcritureLib"]
-        for col in colonnes_requises:
-            if col not in df.columns:
+_lecture_arrow_verifiee = None
+
+
+def lecture_arrow_fiable():
+    """
+    Vérifie une fois par processus, sur un FEC minimal, que la lecture pyarrow rend les
+    valeurs telles quelles (zéros de tête, cellules numériques vides). Sinon moteur C.
+    """
+    global _lecture_arrow_verifiee
+    if _lecture_arrow_verifiee is None:
+        fd, chemin = tempfile.mkstemp(suffix=".txt")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write("EcritureNum|CompteNum|EcritureDate|Montant\n0001|0401000|20240101|12\n0002|0401001||\n")
+            df = lire_fec_arrow(chemin, "utf-8", "|")
+            _lecture_arrow_verifiee = (
+                list(df["EcritureNum"]) == ["0001", "0002"]
+                and list(df["CompteNum"]) == ["0401000", "0401001"]
+                and df["EcritureDate"][0] == "20240101" and df["Montant"][0] == "12"
+                and bool(df["EcritureDate"].isna()[1]) and bool(df["Montant"].isna()[1])
+            )
+        except Exception as e:
+            print("⚠️ Vérification de la lecture pyarrow impossible :", e)
+            _lecture_arrow_verifiee = False
+        finally:
+            os.remove(chemin)
+        if not _lecture_arrow_verifiee:
+            print("⚠️ Lecture pyarrow non fidèle aux valeurs du FEC : moteur C utilisé")
+    return _lecture_arrow_verifiee
+
+COLONNES_FEC = ["CompteNum", "CompteLib", "CompAuxNum", "CompAuxLib", "PieceRef", "EcritureLib"]
+
+def anonymiser_lot_fec(df, contexte, signaler_manquantes=True):
+    """Anonymise en place un DataFrame FEC (fichier entier ou lot) et complète les correspondances."""
+
+    # Colonnes à anonymiser
+    for col in COLONNES_FEC:
+        if col not in df.columns:
+            if signaler_manquantes:
                 print(f"⚠️ Colonne manquante : {col} ➤ créée vide.")
-                df[col] = ""
+            df[col] = ""
 
-        # Anonymisation
-        df["CompteNum"] = df["CompteNum"].apply(anonymiser_compte)
-        df["CompAuxNum"] = df["CompAuxNum"].apply(anonymiser_compte)
-        df["CompteLib"] = df["CompteLib"].apply(lambda x: anonymiser_nom_generique("Client") if pd.notna(x) else x)
-        df["CompAuxLib"] = df["CompAuxLib"].apply(lambda x: anonymiser_client_generique() if pd.notna(x) else x)
-        df["PieceRef"] = df["PieceRef"].apply(anonymiser_piece)
-        df["EcritureLib"] = df["EcritureLib"].apply(lambda x: "Libellé anonymisé" if pd.notna(x) else x)
+    # Anonymisation
+    df["CompteNum"] = anonymiser_comptes(df["CompteNum"])
+    df["CompAuxNum"] = anonymiser_comptes(df["CompAuxNum"])
+    df["CompteLib"] = pseudonymes_stables(df["CompteLib"], "Client", contexte.pseudonymes_comptes)
+    df["CompAuxLib"] = pseudonymes_stables(df["CompAuxLib"], "Client", contexte.pseudonymes_tiers)
+    df["PieceRef"] = anonymiser_pieces(df["PieceRef"], contexte.rng)
+    df["EcritureLib"] = df["EcritureLib"].mask(df["EcritureLib"].notna(), "Libellé anonymisé")
 
-        # Création dossier si nécessaire
-        os.makedirs(DOSSIER_ANONYMISÉ, exist_ok=True)
 
-        # Export anonymisé
-        nom_fichier = os.path.basename(chemin_fichier)
-        sortie = os.path.join(DOSSIER_ANONYMISÉ, f"anonymise_{nom_fichier}")
+def ecrire_fec_anonymise(chemin_fichier, sortie, encoding, sep, contexte):
+    """
+    Lit le FEC, l'anonymise et l'écrit dans sortie. Au-delà de fec_streaming_seuil_mo,
+    le fichier est traité par lots de fec_lignes_par_lot lignes ajoutés au fur et à mesure :
+    la mémoire reste bornée, les correspondances restent les mêmes d'un lot à l'autre.
+    Lève UnicodeDecodeError si le fichier n'est pas lisible dans cet encodage.
+    """
+    # Correspondances propres au fichier (et à la lecture : une relecture repart de zéro)
+    contexte.pseudonymes_comptes.clear()
+    contexte.pseudonymes_tiers.clear()
+
+    if os.path.getsize(chemin_fichier) <= contexte.fec_streaming_seuil_mo * 1024 * 1024:
+        df = None
+        # pyarrow.csv ne lit pas par lots : seul ce chemin en profite, le streaming garde le moteur C
+        if arrow_disponible(contexte) and lecture_arrow_fiable():
+            try:
+                df = lire_fec_arrow(chemin_fichier, encoding, sep)
+            except ValueError as e:
+                if isinstance(e, UnicodeDecodeError):
+                    raise
+                # pyarrow signale un octet invalide par ArrowInvalid : même traitement qu'avec le moteur C
+                if "utf8" in str(e).lower().replace("-", ""):
+                    raise UnicodeDecodeError(encoding, b"", 0, 1, str(e))
+                print("⚠️ Lecture pyarrow impossible, moteur C :", e)
+        if df is None:
+            df = pd.read_csv(chemin_fichier, **options_lecture_fec(encoding, sep, contexte))
+        anonymiser_lot_fec(df, contexte)
         df.to_csv(sortie, sep=sep, index=False, encoding='utf-8')
+        return
+
+    print(f"🌊 FEC volumineux : traitement par lots de {contexte.fec_lignes_par_lot} lignes")
+    options = options_lecture_fec(encoding, sep, contexte)
+    with pd.read_csv(chemin_fichier, chunksize=contexte.fec_lignes_par_lot, **options) as lots:
+        for i, df in enumerate(lots):
+            anonymiser_lot_fec(df, contexte, signaler_manquantes=i == 0)
+            df.to_csv(sortie, sep=sep, index=False, encoding='utf-8', mode="w" if i == 0 else "a", header=i == 0)
+
+# --- Fonction principale ---
+def anonymiser_fichier_fec(chemin_fichier, contexte=None):
+    contexte = contexte or ContexteAnonymisation()
+    try:
+        encoding, sep = sonder_fec(chemin_fichier)
+
+        nom_fichier = os.path.basename(chemin_fichier)
+        sortie = contexte.chemin_sortie(f"anonymise_{nom_fichier}")
+
+        try:
+            ecrire_fec_anonymise(chemin_fichier, sortie, encoding, sep, contexte)
+        except UnicodeDecodeError:
+            # Octet non UTF-8 après l'échantillon : seconde lecture complète en latin1
+            # (la sortie, même partiellement écrite par lots, est réécrite depuis le début)
+            print("⚠️ FEC non UTF-8 au-delà de l'échantillon : relecture en latin1")
+            ecrire_fec_anonymise(chemin_fichier, sortie, "latin1", sep, contexte)
+
+        if contexte.fec_export_correspondances:
+            # Le FEC anonymisé est déjà écrit : un échec d'export (clé invalide...) ne l'annule pas
+            try:
+                exporter_correspondances(nom_fichier, contexte)
+            except Exception as e:
+                print("❌ Export de la table de correspondance impossible :", e)
+
         print(f"✅ Fichier anonymisé enregistré dans : {sortie}")
         return sortie
 
@@ -116,39 +517,26 @@ def anonymiser_fichier_fec(chemin_fichier):
         return None
 
 # === PDF OCR ===
+# Emplacements du conteneur et workers ocrmypdf persistants : voir ocr.py
 
-
-def ocr_worker(input_pdf, output_pdf, queue):
+def anonymiser_pdf_ocr(chemin_pdf, contexte=None):
+    contexte = contexte or ContexteAnonymisation()
     try:
-        ocrmypdf.ocr(
-            input_pdf,
-            output_pdf,
-            language='fra',
-            force_ocr=True,
+        PDF_OCR = contexte.chemin_travail("ocr.pdf")
+        PDF_SORTIE = contexte.chemin_sortie("anonymise_" + os.path.basename(chemin_pdf))
+
+        ocr_ok = lancer_ocr(
+            chemin_pdf,
+            PDF_OCR,
             output_type='pdf',
             optimize=0,
             deskew=False,
             remove_background=False,
-            jobs=1,
             skip_big=20.0,
             oversample=100
         )
-        queue.put("ok")
-    except Exception as e:
-        print("❌ OCR worker failed :", e)
-        queue.put("fail")
-
-def anonymiser_pdf_ocr(chemin_pdf):
-    try:
-        PDF_OCR = chemin_pdf.replace(".pdf", "_OCR.pdf")
-        PDF_SORTIE = os.path.join(DOSSIER_ANONYMISÉ, "anonymise_" + os.path.basename(chemin_pdf))
-
-        queue = Queue()
-        p = Process(target=ocr_worker, args=(chemin_pdf, PDF_OCR, queue))
-        p.start()
-        p.join(timeout=120)  # max 2 min OCR
 
-        if not queue.empty() and queue.get() == "ok":
+        if ocr_ok:
             print("✅ OCR terminé :", PDF_OCR)
         else:
             print("❌ OCR échoué ou timeout")
@@ -182,6 +570,8 @@ def anonymiser_pdf_ocr(chemin_pdf):
             modifications = []
             x_offset, y_offset = -2, 8
 
+            # Collecte des spans de la page, puis NER en un seul passage nlp.pipe
+            spans_page = []
             for block in blocks:
                 if block["type"] != 0:
                     continue
@@ -192,59 +582,61 @@ def anonymiser_pdf_ocr(chemin_pdf):
                     regex_nom = r"(Madame|Monsieur|M\.|Mme)\s+([A-Z][a-zéèêëàâäîïôöûüç'’\-]+\s+){0,3}[A-Z]{2,}(?:\s+[A-Z]{2,})*"
                     match_nom = re.search(regex_nom, line_text)
                     nom_detecte = match_nom.group() if match_nom else None
-                    nom_remplace = False
 
                     # ✅ Correction ici : regex_adresse
                     regex_adresse = r"\b\d{1,4}\s+(rue|avenue|boulevard|chemin|impasse|allée|place)\s+[A-ZÉÈA-Za-zàâäéèêëïîôöùûüç'’\-]+"
                     match_adresse = re.search(regex_adresse, line_text, re.IGNORECASE)
                     adresse_detectee = match_adresse.group() if match_adresse else None
-                    adresse_remplacee = False
 
                     for span in line["spans"]:
-                        text = span["text"].strip()
-                        x0, y0 = span["bbox"][:2]
-                        font_size = span["size"]
-                        texte_anonymise = text
-
-                        # Détection NLP
-                        try:
-                            if text.strip():
-                                doc_spacy = nlp(text)
-                            else:
-                                continue
-                        except Exception as e:
-                            print(f"⛔ Erreur NLP sur : {text[:50]} → {e}")
-                            continue
-
-                        for ent in doc_spacy.ents:
-                            val = ent.text.strip()
-                            label = ent.label_.upper()
-                            if (
-                                    est_info_non_sensible(val)
-                                    or (label == "ADRESSE" and not est_vraie_adresse(val))
-                                    or (label == "MATRICULE" and not est_vrai_matricule(val))
-                                    or est_montant(val)
-                            ):
-                                continue
-                            if label in LABELS_SENSIBLES and val in texte_anonymise:
-                                texte_anonymise = texte_anonymise.replace(val, "*" * len(val))
-
-
-                        # Si nom détecté, anonymiser ses spans
-                        if nom_detecte and text in nom_detecte:
-                            print(f"🔒 Partie du NOM détectée : {text}")
-                            texte_anonymise = ""
-
-                        # Si adresse détectée, anonymiser ses spans
-                        if adresse_detectee and text in adresse_detectee:
-                            print(f"🔒 Partie de l'ADRESSE détectée : {text}")
-                            texte_anonymise = ""
-
-                        # Appliquer la modification visuelle
-                        if texte_anonymise != text:
-                            page.add_redact_annot(span["bbox"], fill=(1, 1, 1))
-                            modifications.append((x0 + x_offset, y0 + y_offset, texte_anonymise, font_size))
-                            total_anonymise += 1
+                        if span["text"].strip():
+                            spans_page.append((span, nom_detecte, adresse_detectee))
+
+            try:
+                ents_spans = entites_par_lot("nlp", [span["text"].strip() for span, _, _ in spans_page])
+            except Exception as e:
+                print(f"⛔ Erreur NLP page {page_num + 1} → {e}")
+                ents_spans = [None] * len(spans_page)
+
+            for (span, nom_detecte, adresse_detectee), ents in zip(spans_page, ents_spans):
+                text = span["text"].strip()
+                x0, y0 = span["bbox"][:2]
+                font_size = span["size"]
+                texte_anonymise = text
+
+                # Détection NLP
+                if ents is None:
+                    continue
+
+                for ent in ents:
+                    val = ent.text.strip()
+                    label = ent.label_.upper()
+                    if (
+                            est_info_non_sensible(val)
+                            or (label == "ADRESSE" and not est_vraie_adresse(val))
+                            or (label == "MATRICULE" and not est_vrai_matricule(val))
+                            or est_montant(val)
+                    ):
+                        continue
+                    if label in LABELS_SENSIBLES and val in texte_anonymise:
+                        texte_anonymise = texte_anonymise.replace(val, "*" * len(val))
+
+
+                # Si nom détecté, anonymiser ses spans
+                if nom_detecte and text in nom_detecte:
+                    print(f"🔒 Partie du NOM détectée : {text}")
+                    texte_anonymise = ""
+
+                # Si adresse détectée, anonymiser ses spans
+                if adresse_detectee and text in adresse_detectee:
+                    print(f"🔒 Partie de l'ADRESSE détectée : {text}")
+                    texte_anonymise = ""
+
+                # Appliquer la modification visuelle
+                if texte_anonymise != text:
+                    page.add_redact_annot(span["bbox"], fill=(1, 1, 1))
+                    modifications.append((x0 + x_offset, y0 + y_offset, texte_anonymise, font_size))
+                    total_anonymise += 1
 
             page.apply_redactions()
             for x, y, txt, size in modifications:
@@ -270,68 +662,136 @@ def anonymiser_pdf_ocr(chemin_pdf):
 
 
 # === PDF simple ===
-def anonymiser_pdf_simple(chemin_pdf):
-    try:
-        PDF_SORTIE = os.path.join(DOSSIER_ANONYMISÉ, "anonymise_" + os.path.basename(chemin_pdf))
-        doc = fitz.open(chemin_pdf)
+# Au-delà de ce nombre de pages, le PDF est découpé en plages traitées par plusieurs processus
+PAGES_PARALLELE_SEUIL = int(os.environ.get("PAGES_PARALLELE_SEUIL", 20))
+# Budget CPU partagé avec jobs.py : WEB_CONCURRENCY workers web × JOB_WORKERS processus de jobs
+# occupent déjà les cœurs ; chaque job n'ouvre des processus de pages que sur ce qui reste
+# (1 par défaut, donc traitement séquentiel, sauf si ANONYMISEUR_JOB_WORKERS est réduit)
+PAGES_WORKERS = int(os.environ.get(
+    "PAGES_WORKERS", min(4, max(1, (os.cpu_count() or 1) // (jobs.WEB_WORKERS * jobs.JOB_WORKERS)))
+))
+
+def anonymiser_pages_simple(doc, numeros_pages):
+    """Anonymise en place les pages numeros_pages d'un document fitz ouvert."""
+    x_offset, y_offset = -2, 8
+    LABELS_SENSIBLES = ["NOM", "ADRESSE", "SIRET", "NSS", "DATE", "CODE_NAF", "URSSAF", "MATRICULE"]
+
+    def est_montant(text):
+        text = text.strip()
+        return bool(
+            re.fullmatch(r"[\d\s.,-]+", text) and not re.fullmatch(r"\d{5,}", text)
+        ) or re.search(r"(euros?|net|brut|montant|versé|payer|rémunération|salaire)", text.lower())
+
+    def est_vrai_matricule(text):
+        return bool(re.fullmatch(r"[A-Z]{2,}[0-9]{2,}", text.strip()))
+
+    def est_vraie_adresse(text):
+        mots_adresse = ["rue", "avenue", "bd", "boulevard", "impasse", "chemin", "allée"]
+        return any(mot in text.lower() for mot in mots_adresse) or bool(re.fullmatch(r"\d{5} [A-ZÉÈÀ\- ]+", text))
+
+    def est_info_non_sensible(text):
+        if "XPERT-IA" in text:
+            return True
+        if re.search(r"\d{1,3} avenue magellan", text.lower()):
+            return True
+        return False
+
+    for page_number in numeros_pages:
+        page = doc[page_number]
+        print(f"\n📄 Traitement de la page {page_number + 1}")
         modifications = []
-        x_offset, y_offset = -2, 8
-        LABELS_SENSIBLES = ["NOM", "ADRESSE", "SIRET", "NSS", "DATE", "CODE_NAF", "URSSAF", "MATRICULE"]
+        blocks = page.get_text("dict")["blocks"]
+        spans = [
+            span
+            for block in blocks if block['type'] == 0
+            for line in block['lines']
+            for span in line['spans']
+        ]
+        # NER de tous les spans de la page en un seul passage nlp.pipe
+        ents_spans = entites_par_lot("nlp", [span['text'] for span in spans])
+        for span, ents in zip(spans, ents_spans):
+            text = span['text']
+            x0, y0 = span['bbox'][:2]
+            font_size = span['size']
+            texte_anonymise = text
+            for ent in ents:
+                label, val = ent.label_, ent.text.strip()
+                if (
+                    est_info_non_sensible(val) or
+                    (label == "ADRESSE" and not est_vraie_adresse(val)) or
+                    (label == "MATRICULE" and not est_vrai_matricule(val)) or
+                    est_montant(val)
+                ):
+                    print(f"⛔ Ignoré : {val} ({label})")
+                    continue
+                if label in LABELS_SENSIBLES:
+                    texte_anonymise = texte_anonymise.replace(val, "*" * len(val))
+            if texte_anonymise != text:
+                print(f"🔒 Bloc anonymisé : {text.strip()} ➡️ {texte_anonymise.strip()}")
+                page.add_redact_annot(span['bbox'], fill=(1, 1, 1))
+                modifications.append((x0 + x_offset, y0 + y_offset, texte_anonymise, font_size))
+        page.apply_redactions()
+        for x0, y0, texte, font_size in modifications:
+            page.insert_text((x0, y0), texte, fontsize=font_size, color=(0, 0, 0))
 
-        def est_montant(text):
-            text = text.strip()
-            return bool(
-                re.fullmatch(r"[\d\s.,-]+", text) and not re.fullmatch(r"\d{5,}", text)
-            ) or re.search(r"(euros?|net|brut|montant|versé|payer|rémunération|salaire)", text.lower())
 
-        def est_vrai_matricule(text):
-            return bool(re.fullmatch(r"[A-Z]{2,}[0-9]{2,}", text.strip()))
+def anonymiser_plage_simple(chemin_pdf, debut, fin, chemin_sortie):
+    """Exécuté dans un worker : anonymise les pages [debut, fin) avec son propre handle fitz."""
+    with fitz.open(chemin_pdf) as doc:
+        anonymiser_pages_simple(doc, range(debut, fin))
+        doc.select(list(range(debut, fin)))
+        doc.save(chemin_sortie, garbage=3)
+    return chemin_sortie
 
-        def est_vraie_adresse(text):
-            mots_adresse = ["rue", "avenue", "bd", "boulevard", "impasse", "chemin", "allée"]
-            return any(mot in text.lower() for mot in mots_adresse) or bool(re.fullmatch(r"\d{5} [A-ZÉÈÀ\- ]+", text))
 
-        def est_info_non_sensible(text):
-            if "XPERT-IA" in text:
-                return True
-            if re.search(r"\d{1,3} avenue magellan", text.lower()):
-                return True
-            return False
-
-        for page_number, page in enumerate(doc):
-            print(f"\n📄 Traitement de la page {page_number + 1}")
-            blocks = page.get_text("dict")["blocks"]
-            for block in blocks:
-                if block['type'] == 0:
-                    for line in block['lines']:
-                        for span in line['spans']:
-                            text = span['text']
-                            x0, y0 = span['bbox'][:2]
-                            font_size = span['size']
-                            doc_spacy = nlp(text)
-                            texte_anonymise = text
-                            for ent in doc_spacy.ents:
-                                label, val = ent.label_, ent.text.strip()
-                                if (
-                                    est_info_non_sensible(val) or
-                                    (label == "ADRESSE" and not est_vraie_adresse(val)) or
-                                    (label == "MATRICULE" and not est_vrai_matricule(val)) or
-                                    est_montant(val)
-                                ):
-                                    print(f"⛔ Ignoré : {val} ({label})")
-                                    continue
-                                if label in LABELS_SENSIBLES:
-                                    texte_anonymise = texte_anonymise.replace(val, "*" * len(val))
-                            if texte_anonymise != text:
-                                print(f"🔒 Bloc anonymisé : {text.strip()} ➡️ {texte_anonymise.strip()}")
-                                page.add_redact_annot(span['bbox'], fill=(1, 1, 1))
-                                modifications.append((x0 + x_offset, y0 + y_offset, texte_anonymise, font_size))
-            page.apply_redactions()
-            for x0, y0, texte, font_size in modifications:
-                page.insert_text((x0, y0), texte, fontsize=font_size, color=(0, 0, 0))
+def anonymiser_pdf_simple_parallele(chemin_pdf, chemin_sortie, nb_pages, dossier_travail=None):
+    taille_plage = -(-nb_pages // PAGES_WORKERS)
+    plages = [(debut, min(debut + taille_plage, nb_pages)) for debut in range(0, nb_pages, taille_plage)]
+    print(f"⚡ {nb_pages} pages réparties en {len(plages)} plages")
+
+    dossier_temp = tempfile.mkdtemp(prefix="pages_", dir=dossier_travail)
+    try:
+        pool = pool_processus("pages", PAGES_WORKERS)
+        try:
+            futures = [
+                pool.submit(anonymiser_plage_simple, chemin_pdf, debut, fin, os.path.join(dossier_temp, f"pages_{debut}.pdf"))
+                for debut, fin in plages
+            ]
+
+            # Fusion dans l'ordre des pages
+            with fitz.open(chemin_pdf) as original, fitz.open() as sortie:
+                for future in futures:
+                    with fitz.open(future.result()) as partiel:
+                        sortie.insert_pdf(partiel)
+                sortie.set_metadata(original.metadata)
+                sortie.save(chemin_sortie)
+        except BrokenProcessPool:
+            # Ce document échoue ; le pool est remplacé pour les documents suivants
+            pool_processus("pages", PAGES_WORKERS, casse=pool)
+            raise
+    finally:
+        shutil.rmtree(dossier_temp, ignore_errors=True)
+
+
+def anonymiser_pdf_simple(chemin_pdf, doc=None, contexte=None):
+    """doc : document fitz déjà ouvert par anonymiser_pdf (il reste à la charge de l'appelant)."""
+    contexte = contexte or ContexteAnonymisation()
+    try:
+        PDF_SORTIE = contexte.chemin_sortie("anonymise_" + os.path.basename(chemin_pdf))
+        proprietaire = doc is None
+        if proprietaire:
+            doc = fitz.open(chemin_pdf)
+        nb_pages = doc.page_count
+
+        if nb_pages >= PAGES_PARALLELE_SEUIL and PAGES_WORKERS > 1:
+            anonymiser_pdf_simple_parallele(chemin_pdf, PDF_SORTIE, nb_pages, contexte.dossier_travail)
+        else:
+            anonymiser_pages_simple(doc, range(nb_pages))
+            doc.save(PDF_SORTIE)
+
+        if proprietaire:
+            doc.close()
 
-        doc.save(PDF_SORTIE)
-        doc.close()
         print(f"\n✅ PDF anonymisé sauvegardé sous : {PDF_SORTIE}")
         return PDF_SORTIE
 
@@ -339,37 +799,58 @@ def anonymiser_pdf_simple(chemin_pdf):
         print("Erreur PDF simple :", str(e))
         return None
 # === Détection type PDF ===
-def anonymiser_pdf(chemin_pdf):
+# Résolution du rendu de la page 1 d'un scan, uniquement pour y chercher "contrat de travail"
+DPI_DETECTION_SCAN = int(os.environ.get("DPI_DETECTION_SCAN", 150))
+
+
+def classifier_pdf(doc):
+    """
+    Classe un PDF ouvert en un seul passage : s'arrête à la première page qui a du texte.
+    Retourne (est_contrat, is_scanned, texte_page1).
+    """
+    texte_page1 = ""
+    for numero, page in enumerate(doc):
+        texte = page.get_text()
+        if numero == 0:
+            texte_page1 = texte.lower()
+        if texte.strip():
+            return "contrat" in texte_page1 and "travail" in texte_page1, False, texte_page1
+
+    # 📸 Scan : OCR de la première page uniquement, en basse résolution
+    import pytesseract
+
+    pix = doc[0].get_pixmap(dpi=DPI_DETECTION_SCAN)
+    image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    texte_ocr = pytesseract.image_to_string(image, lang="fra").lower()
+    return "contrat" in texte_ocr and "travail" in texte_ocr, True, texte_ocr
+
+
+def anonymiser_pdf(chemin_pdf, contexte=None):
+    contexte = contexte or ContexteAnonymisation()
     try:
         with fitz.open(chemin_pdf) as doc:
-            has_text = any(page.get_text().strip() for page in doc)
+            est_contrat, is_scanned, texte_page1 = classifier_pdf(doc)
 
-            if has_text:
-                texte_page1 = doc[0].get_text().lower()
+            if not is_scanned:
                 print("📝 Texte page 1 =", texte_page1[:200])
 
-                if "contrat" in texte_page1 and "travail" in texte_page1:
+                # Le document déjà ouvert et parcouru est transmis tel quel
+                if est_contrat:
                     print("📄 Contrat détecté — traitement complet")
-                    return anonymiser_contrat_complet(chemin_pdf, is_scanned=False)
+                    return anonymiser_contrat_complet(chemin_pdf, is_scanned=False, doc=doc, contexte=contexte)
 
                 print("📄 PDF simple détecté — Anonymisation bulletin")
-                return anonymiser_pdf_simple(chemin_pdf)
+                return anonymiser_pdf_simple(chemin_pdf, doc=doc, contexte=contexte)
 
             else:
-                # 📸 OCR sur la première page uniquement pour détection
-                from pdf2image import convert_from_path
-                import pytesseract
-
-                images = convert_from_path(chemin_pdf, first_page=1, last_page=1, dpi=300)
-                text_ocr = pytesseract.image_to_string(images[0], lang="fra").lower()
-                print("📝 Texte OCR page 1 =", text_ocr[:200])
+                print("📝 Texte OCR page 1 =", texte_page1[:200])
 
-                if "contrat" in text_ocr and "travail" in text_ocr:
+                if est_contrat:
                     print("📄 Contrat scanné détecté — traitement complet")
-                    return anonymiser_contrat_complet(chemin_pdf, is_scanned=True)
+                    return anonymiser_contrat_complet(chemin_pdf, is_scanned=True, contexte=contexte)
 
                 print("📄 PDF scanné mais pas contrat — traitement bulletin OCR")
-                return anonymiser_pdf_ocr(chemin_pdf)
+                return anonymiser_pdf_ocr(chemin_pdf, contexte)
 
     except Exception as e:
         print("❌ Erreur lors de la détection du type de PDF :", str(e))
@@ -377,33 +858,155 @@ def anonymiser_pdf(chemin_pdf):
 
 
 
-def anonymiser_contrat_complet(chemin_pdf, is_scanned=True):
+# === Masquage des signatures (YOLO) ===
+# Résolution des pages masquées (images de sortie)
+DPI_SIGNATURES = int(os.environ.get("DPI_SIGNATURES", 300))
+# Résolution du rendu passé au détecteur : YOLO ramène de toute façon l'image à 640 px
+DPI_DETECTION_SIGNATURES = int(os.environ.get("DPI_DETECTION_SIGNATURES", 100))
+# Nombre de pages envoyées ensemble au détecteur
+YOLO_BATCH = int(os.environ.get("YOLO_BATCH", 4))
+
+
+# Pré-filtre : seules les pages candidates sont rendues et passées au détecteur
+MOTS_SIGNATURE = ("fait à", "fait a ", "fait le", "signature", "lu et approuvé", "lu et approuve", "bon pour accord", "signé")
+# Nombre de courbes vectorielles à partir duquel une page peut porter une signature dessinée
+SEUIL_COURBES_SIGNATURE = int(os.environ.get("SEUIL_COURBES_SIGNATURE", 20))
+
+
+def pages_candidates_signature(doc):
+    """
+    Numéros (à partir de 1) des pages pouvant porter une signature, d'après fitz seul :
+    dernière page, mots-clés du texte ("Fait à", "Signature", "Lu et approuvé"...),
+    image (y compris un scan pleine page : fitz n'y voit pas l'écriture manuscrite),
+    ou tracé vectoriel riche en courbes.
+    """
+    candidates = set()
+    for numero, page in enumerate(doc, start=1):
+        texte = page.get_text().lower()
+        if numero == doc.page_count or any(mot in texte for mot in MOTS_SIGNATURE):
+            candidates.add(numero)
+            continue
+
+        if page.get_image_info():
+            candidates.add(numero)
+            continue
+
+        courbes = sum(1 for dessin in page.get_drawings() for item in dessin["items"] if item[0] == "c")
+        if courbes >= SEUIL_COURBES_SIGNATURE:
+            candidates.add(numero)
+    return candidates
+
+
+def rendre_page(page, dpi=DPI_SIGNATURES):
+    """
+    Rend une page fitz et retourne (image BGR, pixmap).
+    L'image est une vue NumPy sur les pixels du pixmap (pas de copie, pas de fichier),
+    convertie en BGR en place ; le pixmap doit rester référencé tant que l'image sert.
+    """
+    import cv2
+
+    pix = page.get_pixmap(dpi=dpi, alpha=False)
+    img = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    if not img.flags.writeable:
+        img = img.copy()
+    cv2.cvtColor(img, cv2.COLOR_RGB2BGR, dst=img)
+    return img, pix
+
+
+def pages_rendues(chemin_pdf, dpi=DPI_SIGNATURES, numeros_pages=None):
+    """Rend un PDF page par page et génère (numéro de page, image BGR, pixmap)."""
+    with fitz.open(chemin_pdf) as doc:
+        for numero, page in enumerate(doc, start=1):
+            if numeros_pages is None or numero in numeros_pages:
+                yield (numero, *rendre_page(page, dpi))
+
+
+def lots_pages(chemin_pdf, taille_lot=YOLO_BATCH, dpi=DPI_SIGNATURES, numeros_pages=None):
+    """Regroupe les pages rendues par lots de taille_lot : au plus un lot en mémoire."""
+    lot = []
+    for page in pages_rendues(chemin_pdf, dpi, numeros_pages):
+        lot.append(page)
+        if len(lot) == taille_lot:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
+
+
+def detecter_signatures(chemin_pdf, candidates=None):
+    """
+    Détecte les signatures des pages candidates sur un rendu basse résolution
+    (DPI_DETECTION_SIGNATURES), par lots. Retourne {numéro de page: [(x1, y1, x2, y2)
+    en points PDF]} pour les pages avec signature.
+    """
+    if candidates is None:
+        with fitz.open(chemin_pdf) as doc:
+            candidates = pages_candidates_signature(doc)
+    print(f"✍️ Pages candidates signature : {sorted(candidates)}")
+
+    echelle = 72 / DPI_DETECTION_SIGNATURES
+    detections = {}
+    for lot in lots_pages(chemin_pdf, YOLO_BATCH, DPI_DETECTION_SIGNATURES, candidates):
+        with _verrous_inference["yolo"]:
+            results = modele_yolo().predict([img for _, img, _ in lot], conf=0.25, save=False)
+        for (numero, _, _), result in zip(lot, results):
+            boites = [tuple(float(v) * echelle for v in box) for box in result.boxes.xyxy.cpu().numpy()]
+            if boites:
+                detections[numero] = boites
+    return detections
+
+
+def masquer_boites(img_cv, boites, texte, echelle_police, dpi=DPI_SIGNATURES):
+    """Masque en place, sur une page rendue à dpi, des boîtes exprimées en points PDF."""
+    import cv2
+
+    facteur = dpi / 72
+    for box in boites:
+        x1, y1, x2, y2 = (int(v * facteur) for v in box)
+        cv2.rectangle(img_cv, (x1, y1), (x2, y2), (255, 255, 255), -1)
+        cv2.putText(img_cv, texte, (x1, y2 - 5), cv2.FONT_HERSHEY_SIMPLEX, echelle_police, (0, 0, 0), 1)
+
+
+def masquer_boites_pdf(page, boites, texte):
+    """
+    Rédige sur une page fitz des boîtes exprimées en points du rendu : le texte et les pixels
+    d'images recouverts sont supprimés du PDF, ainsi que tout tracé vectoriel qui touche une
+    boîte (une signature dessinée dépasse souvent la boîte YOLO). La page reste vectorielle.
+    """
+    rects = [fitz.Rect(box) * page.derotation_matrix for box in boites]
+    for rect in rects:
+        page.add_redact_annot(rect, fill=(1, 1, 1))
+    page.apply_redactions(
+        images=fitz.PDF_REDACT_IMAGE_PIXELS,
+        graphics=fitz.PDF_REDACT_LINE_ART_REMOVE_IF_TOUCHED,
+    )
+    for rect in rects:
+        page.insert_text((rect.x0, rect.y1 - 2), texte, fontsize=6, color=(0, 0, 0))
+
+
+def anonymiser_contrat_complet(chemin_pdf, is_scanned=True, doc=None, contexte=None):
+    contexte = contexte or ContexteAnonymisation()
+    PDF_OCR = contexte.chemin_travail("ocr.pdf") if is_scanned else chemin_pdf
     print(f"🧾 Chemin reçu : {chemin_pdf}")
     print(f"🔍 is_scanned ? {is_scanned}")
-    print(f"📤 OCR sortie : {chemin_pdf.replace('.pdf', '_OCR.pdf') if is_scanned else chemin_pdf}")
+    print(f"📤 OCR sortie : {PDF_OCR}")
     print("📥 Fichier source existe ?", os.path.exists(chemin_pdf))
 
     try:
-        PDF_OCR = chemin_pdf.replace(".pdf", "_OCR.pdf") if is_scanned else chemin_pdf
-        PDF_TEMP = PDF_OCR.replace(".pdf", "_TEMP.pdf")
-        PDF_FINAL = os.path.join(DOSSIER_ANONYMISÉ, "anonymise_" + os.path.basename(chemin_pdf))
+        PDF_TEMP = contexte.chemin_travail("texte_anonymise.pdf")
+        PDF_FINAL = contexte.chemin_sortie("anonymise_" + os.path.basename(chemin_pdf))
 
         if is_scanned:
             print("🔁 Lancement de l'OCR même pour grandes pages...")
-            try:
-                ocrmypdf.ocr(
-                    chemin_pdf,
-                    PDF_OCR,
-                    force_ocr=True,
-                    language="fra",
-                    use_threads=True,
-                    optimize=0,
-                    jobs=1,
-                    deskew=True,
-                    pdf_renderer="sandwich",
-                )
-            except Exception as e:
-                print("❌ Erreur OCR PDF :", e)
+            if not lancer_ocr(
+                chemin_pdf,
+                PDF_OCR,
+                use_threads=True,
+                optimize=0,
+                deskew=True,
+                pdf_renderer="sandwich",
+            ):
+                print("❌ Erreur OCR PDF")
                 return None
 
         # === Règles d’anonymisation
@@ -427,7 +1030,9 @@ def anonymiser_contrat_complet(chemin_pdf, is_scanned=True):
             return texte.strip()
 
         # === Étape 1 : Anonymisation texte via spaCy
-        doc = fitz.open(PDF_OCR)
+        proprietaire = doc is None
+        if proprietaire:
+            doc = fitz.open(PDF_OCR)
         for page in doc:
             blocks = page.get_text("dict")["blocks"]
             modifications = []
@@ -438,12 +1043,12 @@ def anonymiser_contrat_complet(chemin_pdf, is_scanned=True):
                     spans = line['spans']
                     full_line = "".join([s['text'] for s in spans])
                     full_line = corriger_erreurs_ocr(full_line)
-                    doc_spacy = nlp2(full_line)
+                    ents = entites_texte("nlp2", full_line)
                     texte_anonymise = ""
                     last_idx = 0
                     used_spans = []
 
-                    for ent in doc_spacy.ents:
+                    for ent in ents:
                         if ent.label_ in LABELS and not any(ex in ent.text.upper() for ex in EXCLUSIONS):
                             texte_anonymise += full_line[last_idx:ent.start_char] + "*******"
                             last_idx = ent.end_char
@@ -475,28 +1080,17 @@ def anonymiser_contrat_complet(chemin_pdf, is_scanned=True):
                 page.insert_text((x0, y0 + 8), texte, fontsize=size, color=(0, 0, 0))
 
         doc.save(PDF_TEMP)
-        doc.close()
+        if proprietaire:
+            doc.close()
 
         # === Étape 2 : Masquage des signatures (YOLO)
-        images = convert_from_path(PDF_TEMP, dpi=300)
-        images_finales = []
-
-        for i, image_pil in enumerate(images):
-            print(f"\n📄 Traitement image page {i + 1}")
-            img_cv = cv2.cvtColor(np.array(image_pil), cv2.COLOR_RGB2BGR)
-            temp_img = f"temp_page_{i + 1}.jpg"
-            cv2.imwrite(temp_img, img_cv)
-            results = yolo.predict(temp_img, conf=0.25, save=False)[0]
-
-            for box in results.boxes.xyxy.cpu().numpy():
-                x1, y1, x2, y2 = map(int, box)
-                cv2.rectangle(img_cv, (x1, y1), (x2, y2), (255, 255, 255), -1)
-                cv2.putText(img_cv, "[signature masquee]", (x1, y2 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 1)
-
-            img_pil_final = Image.fromarray(cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB))
-            images_finales.append(img_pil_final)
-
-        images_finales[0].save(PDF_FINAL, save_all=True, append_images=images_finales[1:])
+        # Le contrat reste vectoriel : seules les zones de signature détectées sont rédigées
+        detections = detecter_signatures(PDF_TEMP)
+        with fitz.open(PDF_TEMP) as doc_final:
+            for numero, boites in detections.items():
+                print(f"\n📄 Masquage signatures page {numero}")
+                masquer_boites_pdf(doc_final[numero - 1], boites, "[signature masquee]")
+            doc_final.save(PDF_FINAL, garbage=3, deflate=True)
         print(f"\n✅ Contrat anonymisé + signatures masquées : {PDF_FINAL}")
         return PDF_FINAL
 
@@ -582,7 +1176,8 @@ date_naissance_regex_dsn = re.compile(r"'\d{8}'")
 
 
 # === Fonction principale ===
-def anonymiser_fichier_dsn(chemin_fichier):
+def anonymiser_fichier_dsn(chemin_fichier, contexte=None):
+    contexte = contexte or ContexteAnonymisation()
     try:
         with open(chemin_fichier, 'r', encoding='utf-8') as f:
             lignes = f.readlines()
@@ -621,7 +1216,7 @@ def anonymiser_fichier_dsn(chemin_fichier):
 
         # Enregistrement
         nom_fichier = os.path.basename(chemin_fichier)
-        sortie = os.path.join(DOSSIER_ANONYMISÉ, f"anonymise_{nom_fichier}")
+        sortie = contexte.chemin_sortie(f"anonymise_{nom_fichier}")
         # Appliquer anonymisation des adresses
         contenu_anonymise = "\n".join(lignes_anonymisees)
         contenu_anonymise = anonymiser_adresses(contenu_anonymise)
@@ -671,20 +1266,20 @@ def anonymiser_Contrat(pdf_ocr_path, pdf_sortie_path):
             for line in block['lines']:
                 spans = line['spans']
                 full_line = "".join([s['text'] for s in spans])
-                doc_spacy = nlp2(full_line)
+                ents = entites_texte("nlp2", full_line)
 
                 texte_anonymise = ""
                 last_idx = 0
                 used_spans = []
 
-                for ent in doc_spacy.ents:
+                for ent in ents:
                     if ent.label_ in LABELS_READABLE and not any(ex in ent.text.upper() for ex in EXCLUSIONS):
                         texte_anonymise += full_line[last_idx:ent.start_char] + "*******"
                         last_idx = ent.end_char
                         used_spans.append((ent.start_char, ent.end_char))
                 texte_anonymise += full_line[last_idx:]
 
-                if not any(e.label_ == "NOM" for e in doc_spacy.ents):
+                if not any(e.label_ == "NOM" for e in ents):
                     for match in REGEX_NOM_MANUEL.finditer(full_line):
                         span_start, span_end = match.span()
                         if not any(s <= span_start < e or s < span_end <= e for s, e in used_spans):
@@ -710,16 +1305,110 @@ def anonymiser_Contrat(pdf_ocr_path, pdf_sortie_path):
     print(f"\n✅ PDF anonymisé sauvegardé sous : {pdf_sortie_path}")
 
 
-def anonymiser_word_docx(chemin_docx):
+# === Word ===
+# Formats d'image que l'on sait décoder puis réécrire à l'identique avec OpenCV
+EXTENSIONS_IMAGES_DOCX = {"image/png": ".png", "image/jpeg": ".jpg", "image/bmp": ".bmp", "image/tiff": ".tiff"}
+
+
+def paragraphes_docx(doc):
+    """
+    Paragraphes de tous les conteneurs de texte du document : corps, cellules de tableaux
+    (imbriqués compris), en-têtes et pieds de page de chaque section. Les cellules fusionnées
+    et les en-têtes partagés ne sont rendus qu'une fois.
+    """
+    vus = set()
+
+    def parcourir(conteneur):
+        for para in conteneur.paragraphs:
+            if para._p not in vus:
+                vus.add(para._p)
+                yield para
+        for table in conteneur.tables:
+            for ligne in table.rows:
+                for cellule in ligne.cells:
+                    yield from parcourir(cellule)
+
+    yield from parcourir(doc)
+    for section in doc.sections:
+        for entete in (
+            section.header, section.first_page_header, section.even_page_header,
+            section.footer, section.first_page_footer, section.even_page_footer,
+        ):
+            # Un en-tête lié au précédent n'a pas de contenu propre (y accéder en créerait un)
+            if not entete.is_linked_to_previous:
+                yield from parcourir(entete)
+
+
+def remplacer_texte_paragraphe(para, nouveau_texte):
+    """
+    Réécrit un paragraphe run par run pour conserver sa mise en forme. Les masquages
+    gardent la longueur du texte : chaque run reprend sa tranche du nouveau texte.
+    """
+    runs = para.runs
+    if len(nouveau_texte) != len(para.text) or "".join(run.text for run in runs) != para.text:
+        # Texte hors des runs (liens hypertexte, champs...) : réécriture complète
+        para.text = nouveau_texte
+        return
+
+    debut = 0
+    for run in runs:
+        fin = debut + len(run.text)
+        if run.text != nouveau_texte[debut:fin]:
+            run.text = nouveau_texte[debut:fin]
+        debut = fin
+
+
+def images_docx(doc):
+    """Parts image du paquet DOCX : corps, en-têtes et pieds de page, images inline ou ancrées."""
+    return [part for part in doc.part.package.iter_parts() if part.content_type.startswith("image/")]
+
+
+def masquer_signatures_images_docx(parts_images, texte="[signature masquée]"):
+    """
+    Cherche les signatures directement dans les images intégrées du DOCX (par lots YOLO)
+    et remplace les images concernées dans le paquet. Retourne le nombre d'images masquées,
+    ou None si une image n'est pas exploitable ici et qu'il faut passer par le rendu des pages.
+    """
+    import cv2
+
+    if any(part.content_type not in EXTENSIONS_IMAGES_DOCX for part in parts_images):
+        return None
+
+    nb_masquees = 0
+    for debut in range(0, len(parts_images), YOLO_BATCH):
+        lot = parts_images[debut:debut + YOLO_BATCH]
+        images = [cv2.imdecode(np.frombuffer(part.blob, dtype=np.uint8), cv2.IMREAD_COLOR) for part in lot]
+        if any(img is None for img in images):
+            return None
+
+        with _verrous_inference["yolo"]:
+            results = modele_yolo().predict(images, conf=0.25, save=False)
+        for part, img, result in zip(lot, images, results):
+            boxes = result.boxes.xyxy.cpu().numpy()
+            if not len(boxes):
+                continue
+            # Boîtes en pixels de l'image : dpi=72 donne un facteur 1
+            masquer_boites(img, boxes, texte, 0.5, dpi=72)
+            # python-docx n'expose pas de setter pour le contenu d'une image
+            part._blob = cv2.imencode(EXTENSIONS_IMAGES_DOCX[part.content_type], img)[1].tobytes()
+            nb_masquees += 1
+    return nb_masquees
+
+
+def anonymiser_word_docx(chemin_docx, contexte=None):
     """
     Anonymise un fichier Word (.docx uniquement), masque les signatures
     et retourne le chemin du fichier anonymisé.
     """
+    contexte = contexte or ContexteAnonymisation()
     try:
         if chemin_docx.lower().endswith(".doc") and not chemin_docx.lower().endswith(".docx"):
             print("❌ Format .doc non supporté. Veuillez convertir ce fichier en .docx.")
             return None
 
+        from docx import Document
+        from docx.shared import Inches
+
         # ---------- 1. Anonymisation texte ----------
         LABELS_SENSIBLES = {"NOM", "ADRESSE", "SIRET", "NSS", "DATE", "DATE_NAISSANCE", "CODE_NAF", "ENTREPRISE", "MATRICULE", "URSSAF"}
         PROTECTED_KEYWORDS = [
@@ -736,15 +1425,18 @@ def anonymiser_word_docx(chemin_docx):
         doc = Document(chemin_docx)
         noms_detectes = set()
 
-        for para in doc.paragraphs:
-            texte = original_text = para.text
-            if any(k.lower() in texte.lower() for k in PROTECTED_KEYWORDS):
-                continue
+        # Corps, tableaux, en-têtes et pieds de page : un seul passage NER par lots
+        paragraphes = [
+            para for para in paragraphes_docx(doc)
+            if para.text.strip() and not any(k.lower() in para.text.lower() for k in PROTECTED_KEYWORDS)
+        ]
+        entites = entites_par_lot("nlp2", [para.text for para in paragraphes])
 
-            doc_spacy = nlp2(texte)
+        for para, ents in zip(paragraphes, entites):
+            texte = original_text = para.text
             new_text, offset, used_spans = texte, 0, []
 
-            for ent in doc_spacy.ents:
+            for ent in ents:
                 if ent.label_ in LABELS_SENSIBLES and ent.text.strip() not in ["Madame", "Monsieur"]:
                     start, end = ent.start_char + offset, ent.end_char + offset
                     new_text = new_text[:start] + "*" * len(ent.text) + new_text[end:]
@@ -777,51 +1469,45 @@ def anonymiser_word_docx(chemin_docx):
 
             if new_text != original_text:
                 print(f"🔒 Paragraphe modifié : {original_text.strip()} ➡️ {new_text.strip()}")
-                para.text = new_text
-
-        # Fichier docx anonymisé
-        docx_anonyme = os.path.join(tempfile.gettempdir(), os.path.basename(chemin_docx).replace(".docx", "_anonyme.docx"))
-        doc.save(docx_anonyme)
-
-        # ---------- 2. Conversion en images pour traitement YOLO ----------
-        pdf_temp = os.path.join(tempfile.gettempdir(), "temp_pdf.pdf")
-        subprocess.run(
-            ["libreoffice", "--headless", "--convert-to", "pdf", "--outdir", os.path.dirname(pdf_temp), docx_anonyme],
-            check=True
-        )
+                remplacer_texte_paragraphe(para, new_text)
 
-        images = convert_from_path(pdf_temp, dpi=300)
-        yolo_detecte_signature = False
-        images_finales = []
+        nom_final = os.path.basename(chemin_docx).replace(".docx", "_anonymise.docx")
+        sortie_docx = contexte.chemin_sortie(nom_final)
+
+        # ---------- 2. Signatures : directement dans les images intégrées ----------
+        parts_images = images_docx(doc)
+        nb_masquees = masquer_signatures_images_docx(parts_images) if parts_images else 0
+
+        if not parts_images:
+            print("📄 Aucune image dans le document : pas de recherche de signature")
+            doc.save(sortie_docx)
+        elif nb_masquees is not None:
+            print(f"✍️ Images avec signature masquée : {nb_masquees}")
+            doc.save(sortie_docx)
+        else:
+            # Images non décodables (EMF, WMF...) : rendu des pages via LibreOffice + YOLO
+            from office import convertir_en_pdf
 
-        for i, image_pil in enumerate(images):
-            img_cv = cv2.cvtColor(np.array(image_pil), cv2.COLOR_RGB2BGR)
-            temp_img_path = os.path.join(tempfile.gettempdir(), f"page_{i + 1}.jpg")
-            cv2.imwrite(temp_img_path, img_cv)
-            results = yolo.predict(temp_img_path, conf=0.25, save=False)[0]
+            docx_anonyme = contexte.chemin_travail("document.docx")
+            doc.save(docx_anonyme)
 
-            if len(results.boxes) > 0:
-                yolo_detecte_signature = True
-                for box in results.boxes.xyxy.cpu().numpy():
-                    x1, y1, x2, y2 = map(int, box)
-                    cv2.rectangle(img_cv, (x1, y1), (x2, y2), (255, 255, 255), -1)
-                    cv2.putText(img_cv, "[signature masquée]", (x1, y2 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+            pdf_temp = convertir_en_pdf(docx_anonyme, contexte.dossier_travail)
 
-            images_finales.append(Image.fromarray(cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB)))
+            # Détection en basse résolution ; la pleine résolution n'est rendue que s'il faut masquer
+            detections = detecter_signatures(pdf_temp)
 
-        # ---------- 3. Génération du fichier final ----------
-        nom_final = os.path.basename(chemin_docx).replace(".docx", "_anonymise.docx")
-        sortie_docx = os.path.join(DOSSIER_ANONYMISÉ, nom_final)
+            # ---------- 3. Génération du fichier final ----------
+            if not detections:
+                os.replace(docx_anonyme, sortie_docx)
+            else:
+                import cv2
 
-        if not yolo_detecte_signature:
-            os.replace(docx_anonyme, sortie_docx)
-        else:
-            final_docx = Document()
-            for i, image in enumerate(images_finales):
-                temp_image_path = os.path.join(tempfile.gettempdir(), f"masked_page_{i + 1}.jpg")
-                image.save(temp_image_path, "JPEG")
-                final_docx.add_paragraph().add_run().add_picture(temp_image_path, width=Inches(6.5))
-            final_docx.save(sortie_docx)
+                final_docx = Document()
+                for numero, img_cv, _ in pages_rendues(pdf_temp):
+                    masquer_boites(img_cv, detections.get(numero, []), "[signature masquée]", 0.5)
+                    jpeg = cv2.imencode(".jpg", img_cv)[1].tobytes()
+                    final_docx.add_paragraph().add_run().add_picture(io.BytesIO(jpeg), width=Inches(6.5))
+                final_docx.save(sortie_docx)
 
         print(f"✅ Fichier final enregistré : {sortie_docx}")
         return sortie_docx
@@ -832,17 +1518,62 @@ def anonymiser_word_docx(chemin_docx):
         return None
 
 
-def anonymiser_fichier(chemin_fichier):
+def parametres_sortie(contexte):
+    """Version du pipeline et réglages dont dépend le fichier produit (clé du cache)."""
+    return {
+        "version": VERSION_PIPELINE,
+        "dpi_signatures": DPI_SIGNATURES,
+        "dpi_detection_signatures": DPI_DETECTION_SIGNATURES,
+        "dpi_detection_scan": DPI_DETECTION_SCAN,
+        "seuil_courbes_signature": SEUIL_COURBES_SIGNATURE,
+        "mots_signature": MOTS_SIGNATURE,
+        "detecteur_signature": DETECTEUR_SIGNATURE,
+        "fec_streaming_seuil_mo": contexte.fec_streaming_seuil_mo,
+        "fec_lignes_par_lot": contexte.fec_lignes_par_lot,
+        "fec_arrow": contexte.fec_arrow,
+    }
+
+
+def nom_sortie(chemin_fichier, contexte):
+    """Chemin du fichier anonymisé tel que le produisent les fonctions ci-dessus."""
+    nom_fichier = os.path.basename(chemin_fichier)
+    if nom_fichier.lower().endswith(".docx"):
+        return contexte.chemin_sortie(nom_fichier.replace(".docx", "_anonymise.docx"))
+    return contexte.chemin_sortie(f"anonymise_{nom_fichier}")
+
+
+def anonymiser_fichier(chemin_fichier, contexte=None):
+    """
+    Anonymise un fichier selon son extension. contexte : ContexteAnonymisation du job
+    (dossier de sortie, réglages) ; un contexte par défaut est créé s'il est absent.
+    """
+    contexte = contexte or ContexteAnonymisation()
     ext = os.path.splitext(chemin_fichier)[1].lower()
 
     if ext in {".csv", ".txt"}:
-        return anonymiser_fichier_fec(chemin_fichier)
+        fonction = anonymiser_fichier_fec
     elif ext == ".pdf":
-        return anonymiser_pdf(chemin_fichier)
+        fonction = anonymiser_pdf
     elif ext == ".edi":
-        return anonymiser_fichier_dsn(chemin_fichier)
+        fonction = anonymiser_fichier_dsn
     elif ext in {".doc", ".docx"}:
-        return anonymiser_word_docx(chemin_fichier)
+        fonction = anonymiser_word_docx
     else:
         print("❓ Format non pris en charge :", ext)
         return None
+
+    # Un fichier identique déjà anonymisé avec les mêmes modèles est servi depuis le cache,
+    # sauf un FEC dont la table de correspondance doit être exportée pour ce job
+    avec_cache = not (fonction is anonymiser_fichier_fec and contexte.fec_export_correspondances)
+    cle = cache.calculer_cle(
+        chemin_fichier, ext, [MODELE_PATH, MODELE_PATH2, chemin_detecteur()], parametres_sortie(contexte)
+    )
+    sortie = nom_sortie(chemin_fichier, contexte)
+    if avec_cache and cache.lire(cle, sortie):
+        return sortie
+
+    resultat = fonction(chemin_fichier, contexte=contexte)
+    if resultat and avec_cache:
+        cache.ecrire(cle, resultat)
+    print("🧠 Cache NER :", statistiques_cache_ner())
+    return resultat